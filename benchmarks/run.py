@@ -0,0 +1,168 @@
+#!env python
+# Stage benchmarks on synthetic catalogs, e.g.:
+#   python -m benchmarks.run --rows 1000 10000 --output bench.json
+#   python -m benchmarks.run --rows 10000 --compare bench.json
+import argparse
+import contextlib
+import datetime
+import gc
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from src import generate, imagestore, media, process
+from .synthetic import make_sheet
+from .standins import ImageServer, Providers, Sheets, patched, site_dir
+
+STAGES = ['fetch', 'clean', 'keywords', 'images', 'generate']
+
+
+def run_stage(func, rows, trace_memory):
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    # Stages print progress and review notes, keep them out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, {
+        'seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4),
+        'rows': rows,
+        'rows_per_second': round(rows / wall, 1) if wall else None,
+        'peak_memory_bytes': peak,
+    }
+
+
+def bench(rows, stages, seed=0, workers=media.DOWNLOAD_WORKERS, image_latency=0.0, api_latency=0.0, trace_memory=True):
+    report = {'rows': rows, 'stages': {}}
+    sheet = make_sheet(rows, seed)
+
+    if 'fetch' in stages:
+        sheets = Sheets(sheet, latency=api_latency)
+        with site_dir() as basedir, patched(process.gspread, service_account=sheets.service_account):
+            # The snapshot goes to the throw-away directory, not to the real cache
+            cache_dir = os.path.join(basedir, '.cache')
+            with patched(process, CACHE_DIR=cache_dir, SHEET_SNAPSHOT_PATH=os.path.join(cache_dir, 'sheet.parquet'),
+                         SHEET_SNAPSHOT_META_PATH=os.path.join(cache_dir, 'sheet.json')):
+                _, timing = run_stage(lambda: process.download_gspread(), rows, trace_memory)
+                report['stages']['fetch'] = timing
+                # Second run with the spreadsheet unchanged, read from the snapshot
+                _, timing = run_stage(lambda: process.download_gspread(), rows, trace_memory)
+                report['stages']['fetch_unchanged'] = timing
+        report['sheet_downloads'] = sheets.downloads
+
+    with site_dir() as basedir:
+        # The schema report goes to the throw-away directory, as in a real run
+        report_path = os.path.join(basedir, '.cache', 'schema_report.json')
+        data, timing = run_stage(lambda: process.clean_gspread_data(sheet, report_path=report_path), rows, trace_memory and 'clean' in stages)
+    if 'clean' in stages:
+        report['stages']['clean'] = timing
+    videos = data.to_dict('records')
+    report['videos'] = len(videos)
+
+    keywords = None
+    if 'keywords' in stages or 'generate' in stages:
+        keywords, timing = run_stage(lambda: process.extract_keywords(data), len(videos), trace_memory and 'keywords' in stages)
+        if 'keywords' in stages:
+            report['stages']['keywords'] = timing
+        report['keywords'] = {k: len(v) for k, v in keywords.items()}
+
+    with site_dir() as basedir, ImageServer(latency=image_latency) as server:
+        providers = Providers(server.url, latency=api_latency)
+        images = {}
+        if 'images' in stages:
+            with patched(media, youtube_get_videos=providers.youtube_get_videos, vimeo_get_videos=providers.vimeo_get_videos), \
+                    patched(imagestore, BASEDIR=basedir, IMAGE_INDEX_PATH=os.path.join(basedir, 'imagemeta.json')):
+                images, timing = run_stage(lambda: media.download_images(videos, workers=workers), len(videos), trace_memory)
+            report['stages']['images'] = timing
+            report['api_calls'] = providers.calls
+            report['image_requests'] = server.requests
+            report['image_bytes'] = server.bytes
+
+        if 'generate' in stages:
+            manifest_path = os.path.join(basedir, '.cache', 'content_manifest.json')
+            # Every path generate writes to, or the synthetic videos end up in the real catalog
+            catalog_path = os.path.join(basedir, 'content', 'catalog.jsonl')
+            with patched(generate, BASEDIR=basedir, CONTENT_MANIFEST_PATH=manifest_path, CATALOG_PATH=catalog_path):
+                _, timing = run_stage(lambda: generate.build_site_content(videos, keywords, images), len(videos), trace_memory)
+                report['stages']['generate'] = timing
+                # Second run with nothing changed, the incremental case
+                _, timing = run_stage(lambda: generate.build_site_content(videos, keywords, images), len(videos), trace_memory)
+                report['stages']['generate_unchanged'] = timing
+
+    report['total_seconds'] = round(sum(stage['seconds'] for stage in report['stages'].values()), 4)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    # Print the time ratio of each stage against the baseline, returns the regressed stages
+    regressions = []
+    base_runs = {run['rows']: run for run in baseline['runs']}
+    for run in report['runs']:
+        base = base_runs.get(run['rows'])
+        if base is None:
+            continue
+        for name, stage in run['stages'].items():
+            if name not in base['stages'] or not base['stages'][name]['seconds']:
+                continue
+            ratio = stage['seconds'] / base['stages'][name]['seconds']
+            flag = ''
+            if ratio > tolerance:
+                regressions.append((run['rows'], name, ratio))
+                flag = '  REGRESSION'
+            print(f"{run['rows']:>9} rows  {name:<20} {base['stages'][name]['seconds']:>10.3f}s -> {stage['seconds']:>10.3f}s  x{ratio:.2f}{flag}", file=sys.stderr)
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Benchmark the content pipeline stages on synthetic catalogs')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000], help='catalog sizes to run (default: 1000)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help='stages to time (default: all)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=media.DOWNLOAD_WORKERS, help='image download workers')
+    parser.add_argument('--image-latency', type=float, default=0.0, help='seconds added to each image request')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='seconds added to each provider API call')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace peak memory (tracing slows stages down)')
+    parser.add_argument('--output', help='write the JSON report to this file instead of stdout')
+    parser.add_argument('--compare', help='baseline JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.2, help='slowdown ratio reported as a regression (default: 1.2)')
+    opts = parser.parse_args(args)
+
+    report = {
+        'started': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'runs': [],
+    }
+    for rows in opts.rows:
+        print(f'Running {rows} rows...', file=sys.stderr)
+        report['runs'].append(bench(rows, opts.stages, opts.seed, opts.workers, opts.image_latency, opts.api_latency, not opts.no_memory))
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            regressions = compare(report, json.load(f), opts.tolerance)
+        if regressions:
+            sys.exit(1)
+
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import contextlib
+import math
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src import media
+
+
+class ImageServer:
+    # Local image host: answers any GET with the same jpeg-sized payload
+
+    def __init__(self, latency=0.0, size=20 * 1024):
+        self.latency = latency
+        self.payload = b'\xff\xd8\xff\xe0' + b'\0' * (size - 4)
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                with server._lock:
+                    server.requests += 1
+                    server.bytes += len(server.payload)
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/jpeg')
+                self.send_header('Content-Length', str(len(server.payload)))
+                self.end_headers()
+                self.wfile.write(server.payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Providers:
+    # YouTube and Vimeo stand-ins, returning payloads that point to the local image host
+
+    def __init__(self, image_url, latency=0.0):
+        self.image_url = image_url
+        self.latency = latency
+        self.calls = {'youtube': 0, 'vimeo': 0}
+
+    def _call(self, provider, vids, batch_size):
+        batches = math.ceil(len(vids) / batch_size)
+        self.calls[provider] += batches
+        if self.latency:
+            time.sleep(self.latency * batches)
+
+    def youtube_get_videos(self, vids):
+        self._call('youtube', vids, media.YOUTUBE_BATCH_SIZE)
+        return {vid: {'thumbnails': {
+            'default': {'url': f'{self.image_url}/vi/{vid}/default.jpg', 'width': 120},
+            'high': {'url': f'{self.image_url}/vi/{vid}/hqdefault.jpg', 'width': 480},
+            'maxres': {'url': f'{self.image_url}/vi/{vid}/maxresdefault.jpg', 'width': 1280},
+        }} for vid in vids}
+
+    def vimeo_get_videos(self, vids):
+        self._call('vimeo', vids, media.VIMEO_BATCH_SIZE)
+        return {vid: {'sizes': [
+            {'width': 100, 'link': f'{self.image_url}/video/{vid}_100x75.jpg?r=pad'},
+            {'width': 295, 'link': f'{self.image_url}/video/{vid}_295x166.jpg?r=pad'},
+            {'width': 1280, 'link': f'{self.image_url}/video/{vid}_1280x720.jpg?r=pad'},
+        ]} for vid in vids}
+
+
+class Sheets:
+    # gspread stand-in: service_account() returns a client whose spreadsheet holds the synthetic
+    # sheet, as the raw cell values get_all_values() returns
+
+    def __init__(self, sheet, latency=0.0, modified='2020-01-01T00:00:00.000Z'):
+        self.values = [list(sheet.columns)] + sheet.astype(str).values.tolist()
+        self.latency = latency
+        self.lastUpdateTime = modified
+        self.sheet1 = self
+        self.downloads = 0
+
+    def service_account(self, filename=None):
+        return self
+
+    def open(self, title):
+        return self
+
+    def get_all_values(self):
+        self.downloads += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [list(row) for row in self.values]
+
+
+@contextlib.contextmanager
+def patched(module, **attrs):
+    saved = {name: getattr(module, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(module, name, value)
+
+
+@contextlib.contextmanager
+def site_dir():
+    # Throw-away BASEDIR with the content directories the pipeline writes to
+    with tempfile.TemporaryDirectory(prefix='runningimages-bench-') as basedir:
+        os.makedirs(os.path.join(basedir, 'content', 'images'))
+        os.makedirs(os.path.join(basedir, 'content', 'videos'))
+        yield basedir
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from src import LANG_MAP, NAME_MAPS
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'su', 'te', 'no', 'vi', 'an', 'el', 'jo', 'ber', 'tin', 'mar', 'son', 'dre', 'ly', 'gus']
+COUNTRIES = ['US', 'FR', 'GB', 'ES', 'IT', 'CH', 'NO', 'KE', 'ZA', 'AU', 'CA', 'JP']
+
+# Keyword pool size (relative to the number of rows, with a floor), and number of values per video
+KEYWORD_COLUMNS = {
+    'events': (0.01, 30, 2),
+    'people': (0.3, 100, 4),
+    'sponsors': (0.01, 20, 2),
+    'production': (0.05, 50, 1),
+    'direction': (0.1, 50, 2),
+}
+
+# Share of each kind of video link
+LINK_MIX = {'youtube': 0.5, 'vimeo': 0.25, 'dailymotion': 0.05, 'other': 0.1, 'none': 0.1}
+
+
+def random_names(rng, count, words):
+    parts = rng.integers(0, len(SYLLABLES), size=(count, words, 3))
+    names = {' '.join(''.join(SYLLABLES[s] for s in word).capitalize() for word in name) for name in parts}
+    # Syllable collisions may yield duplicates, pad with numbered names
+    names = sorted(names)
+    return names + [f'{names[0]} {i}' for i in range(count - len(names))]
+
+
+def keyword_column(rng, rows, pool_ratio, pool_min, max_values, fill=0.7):
+    pool = random_names(rng, max(pool_min, int(rows * pool_ratio)), 2)
+    # Zipf-like popularity: few very common keywords, a long tail of rare ones
+    weights = 1 / np.arange(1, len(pool) + 1)
+    picks = rng.choice(len(pool), size=(rows, max_values), p=weights / weights.sum())
+    counts = rng.integers(1, max_values + 1, size=rows)
+    empty = rng.random(rows) > fill
+    return ['' if empty[i] else ','.join(pool[k] for k in picks[i, :counts[i]]) for i in range(rows)]
+
+
+def random_links(rng, rows):
+    kinds = rng.choice(list(LINK_MIX), size=rows, p=list(LINK_MIX.values()))
+    ids = rng.integers(10 ** 7, 10 ** 9, size=rows)
+    links = []
+    for kind, vid in zip(kinds, ids):
+        if kind == 'youtube':
+            links.append(f'https://www.youtube.com/watch?v=yt{vid:09d}')
+        elif kind == 'vimeo':
+            links.append(f'https://vimeo.com/{vid}')
+        elif kind == 'dailymotion':
+            links.append(f'https://www.dailymotion.com/video/x{vid:x}')
+        elif kind == 'other':
+            links.append(f'https://www.example.com/films/{vid}')
+        else:
+            links.append('')
+    return links
+
+
+def make_sheet(rows, seed=0):
+    # Raw "Running Images" sheet, typed like gspread's get_all_records()
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, rows + 1)
+    words = random_names(rng, max(rows // 10, 10), 1)
+    created = pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 1500, size=rows), unit='D')
+    seconds = rng.integers(60, 3 * 3600, size=rows)
+    has_duration = rng.random(rows) < 0.8
+    languages = np.array(list(LANG_MAP) + [''])
+    countries = np.array(COUNTRIES + [''])
+
+    sheet = pd.DataFrame({
+        'id': ids,
+        'saw': rng.choice(['yes', 'no'], size=rows),
+        'export': np.where(rng.random(rows) < 0.95, 'yes', 'no'),
+        'title': [f'{words[i % len(words)]} {i}' for i in ids],
+        'slug': [f"{words[i % len(words)].lower().replace(' ', '_')}_{i}" for i in ids],
+        'release_year': rng.integers(1980, 2022, size=rows),
+        'created': created.strftime('%Y/%m/%d'),
+        'duration': [f'{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}' if d else '' for s, d in zip(seconds, has_duration)],
+        'language': rng.choice(languages, size=rows),
+        'country': rng.choice(countries, size=rows),
+        'description': [f'<p>{words[i % len(words)]} is a running film, number {i} of the catalog.</p>' for i in ids],
+        'free_access': rng.choice(['yes', 'no'], size=rows),
+        'link_stream': random_links(rng, rows),
+        'link_trailer': random_links(rng, rows),
+        'link_official': np.where(rng.random(rows) < 0.3, [f'https://www.example.org/{i}' for i in ids], ''),
+    })
+    for colname, (pool_ratio, pool_min, max_values) in KEYWORD_COLUMNS.items():
+        sheet[colname] = keyword_column(rng, rows, pool_ratio, pool_min, max_values)
+    # Some labels that go through NAME_MAPS
+    labels = list(NAME_MAPS['events'])
+    mapped = rng.random(rows) < 0.1
+    sheet.loc[mapped, 'events'] = rng.choice(labels, size=int(mapped.sum()))
+    return sheet
@@ -1,17 +1,149 @@
 #!env python
-from src.process import build_site_data
-from src.media import download_images
-from src.generate import build_site_content
-import json
+# The modules of each stage are imported when the stage runs: generating the pages from the
+# persisted results of the previous stages does not load pandas, the sheet or the video APIs clients.
+from src import stats
+from src.stages import load_stage, save_stage, plain
+import argparse
 
-def main():
-    videos, kwds = build_site_data()
-    images = download_images(videos)
-    build_site_content(videos, kwds, images)
+STAGES = ['fetch', 'clean', 'keywords', 'images', 'generate', 'search']
 
+
+def run_fetch(opts):
+    from src.process import download_gspread
+    with stats.stage('fetch'):
+        data = download_gspread(opts.offline)
+    save_stage('sheet', data)
+    return data
+
+
+def run_clean(opts, data=None):
+    from src import SCHEMA_REPORT_PATH
+    from src.process import clean_gspread_data
+    data = load_stage('sheet') if data is None else data
+    with stats.stage('clean'):
+        data_df = clean_gspread_data(data, report_path=SCHEMA_REPORT_PATH)
+    stats.incr('rows.in', len(data))
+    stats.incr('rows.out', len(data_df))
+    save_stage('clean', data_df)
+    return data_df
+
+
+def run_keywords(opts, data_df=None):
+    from src.process import extract_keywords
+    from src.related import add_related
+    data_df = load_stage('clean') if data_df is None else data_df
+    with stats.stage('keywords'):
+        kwds = plain(extract_keywords(data_df))
+    videos = plain(data_df.to_dict('records'))
+    with stats.stage('related'):
+        add_related(videos, kwds)
+    save_stage('keywords', {'videos': videos, 'keywords': kwds})
+    return videos, kwds
+
+
+def run_images(opts, videos=None):
+    from src.cache import ApiCache
+    from src.links import check_links, apply_link_status
+    from src.streams import add_media_metas
+    from src.media import download_images
+    from src.images import build_derivatives
+    if videos is None:
+        videos = load_stage('keywords')['videos']
+    with ApiCache(refresh=opts.refresh) as cache:
+        with stats.stage('links'):
+            report = check_links(videos, cache, offline=opts.offline) if opts.check_links else None
+            # Without a check, the dead links of the last one
+            apply_link_status(videos, report)
+            add_media_metas(videos)
+        with stats.stage('images'):
+            images = download_images(videos, cache=cache, offline=opts.offline, refresh=opts.refresh_images)
+        print(f'API cache: {cache.stats()}')
+    with stats.stage('derivatives'):
+        derivatives = build_derivatives(images)
+    result = plain({'videos': videos, 'images': images, 'derivatives': derivatives})
+    save_stage('images', result)
+    return result['videos'], result['images'], result['derivatives']
+
+
+def run_generate(opts, videos=None, kwds=None, images=None, derivatives=None):
+    from src.generate import build_site_content
+    if kwds is None:
+        kwds = load_stage('keywords')['keywords']
+    if videos is None:
+        result = load_stage('images')
+        videos, images, derivatives = result['videos'], result['images'], result['derivatives']
+    with stats.stage('generate'):
+        build_site_content(videos, kwds, images, derivatives, clean=opts.clean)
+    return videos, kwds, images
+
+
+def run_search(opts, videos=None, kwds=None, images=None):
+    # Stage of its own: the index is built with pandas, generate does not load it
+    from src.search import build_search_index
+    if kwds is None:
+        kwds = load_stage('keywords')['keywords']
+    if videos is None:
+        result = load_stage('images')
+        videos, images = result['videos'], result['images']
+    with stats.stage('search'):
+        build_search_index(videos, kwds, images)
     return videos, kwds, images
 
 
+def run_all(opts):
+    data = run_fetch(opts)
+    data_df = run_clean(opts, data)
+    videos, kwds = run_keywords(opts, data_df)
+    videos, images, derivatives = run_images(opts, videos)
+    result = run_generate(opts, videos, kwds, images, derivatives)
+    if not opts.no_search:
+        run_search(opts, videos, kwds, images)
+    return result
+
+
+def add_options(parser, suppress=False):
+    # Options are accepted before and after the command, the command parser only sets the ones given to it
+    default = (lambda value: argparse.SUPPRESS) if suppress else (lambda value: value)
+    parser.add_argument('--refresh', action='store_true', default=default(False), help='ignore cached YouTube/Vimeo responses and fetch them again')
+    parser.add_argument('--refresh-images', action='store_true', default=default(False), help='revalidate downloaded images with conditional requests')
+    parser.add_argument('--clean', action='store_true', default=default(False), help='remove all video pages before writing them')
+    parser.add_argument('--offline', action='store_true', default=default(False), help='build from the local spreadsheet snapshot, without any network access')
+    parser.add_argument('--check-links', action='store_true', default=default(False), help='check the stream, trailer and official links (links checked recently are cached)')
+    parser.add_argument('--no-search', action='store_true', default=default(False), help='do not rebuild the search index when running all the stages')
+    parser.add_argument('--report', default=default(stats.RUN_REPORT_PATH), help='where to write the JSON timings and counters report')
+    parser.add_argument('--profile', default=default(None), choices=['fetch', 'clean', 'keywords', 'related', 'links', 'images', 'derivatives', 'generate', 'search'], help='dump cProfile stats for this stage')
+    parser.add_argument('--profile-output', default=default(None), help='cProfile stats file (default: .cache/<stage>.prof)')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Build the Running Images site content')
+    add_options(parser)
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    helps = {
+        'fetch': 'download the spreadsheet',
+        'clean': 'validate and clean the spreadsheet rows',
+        'keywords': 'extract the keywords and the related videos',
+        'images': 'check the links, download the images and build their derivatives',
+        'generate': 'write the video pages',
+        'search': 'write the search index',
+        'all': 'run all the stages (default)',
+    }
+    for command in STAGES + ['all']:
+        add_options(commands.add_parser(command, help=helps[command]), suppress=True)
+    opts = parser.parse_args(args)
+
+    stats.reset()
+    if opts.profile:
+        stats.profile(opts.profile, opts.profile_output)
+
+    # Each stage reads the results of the previous one from STAGES_DIR
+    runners = {'fetch': run_fetch, 'clean': run_clean, 'keywords': run_keywords, 'images': run_images, 'generate': run_generate,
+               'search': run_search, 'all': run_all}
+    result = runners[opts.command or 'all'](opts)
+    stats.write_report(opts.report)
+
+    return result
+
+
 if __name__ == "__main__":
     main()
-
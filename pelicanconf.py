@@ -8,6 +8,10 @@ PLUGINS = ['runningimages']
 
 LOAD_CONTENT_CACHE = False
 DELETE_OUTPUT_DIRECTORY = True
+CACHE_PATH = '.cache/pelican'
+# Incremental builds (invoke build --incremental, make html INCREMENTAL=1) only render
+# the pages whose articles changed, the state is kept in CACHE_PATH
+RUNNINGIMAGES_INCREMENTAL = False
 AUTHOR = 'Rodolfo Ripado'
 SITENAME = 'Running Images'
 SITEURL = ''
@@ -36,6 +40,10 @@ SOCIAL = (('You can add links in your config file', '#'),
           ('Another social link', '#'),)
 
 DEFAULT_PAGINATION = 20
+# Tag and year pages show the first DEFAULT_PAGINATION videos, the next ones are loaded from the
+# JSON API (RUNNINGIMAGES_API_PATH in the output directory)
+PAGINATED_TEMPLATES = {'index': None}
+RUNNINGIMAGES_API_PATH = 'api'
 ARTICLE_ORDER_BY = "reversed-release_year"
 
 # Uncomment following line if you want document-relative URLs when developing
@@ -44,6 +52,8 @@ ARTICLE_ORDER_BY = "reversed-release_year"
 # Paths
 ARCHIVES_SAVE_AS = ''
 ARTICLE_PATHS = ['videos']
+STATIC_PATHS = ['images', 'search']
+RUNNINGIMAGES_CATALOG = 'catalog.jsonl'
 ARTICLE_EXCLUDES: []
 ARTICLE_SAVE_AS = 'videos/{slug}.html'
 ARTICLE_URL = 'videos/{slug}.html'
@@ -68,3 +78,4 @@ THEME_CATEGORIES_ORDERED = ['x-1999', '2000-2004', '2005-2009', '2010-2014', '20
 with open('sitemeta.json') as f:
     sitemeta = json.load(f)
 TAG_TYPES = sitemeta['tags']
+RUNNINGIMAGES_TAG_SEPARATOR = sitemeta.get('separator', ', ')
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+from markupsafe import Markup
+
+from . import incremental
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the format of the files changes
+API_VERSION = 1
+
+# Article metadata copied to the video records
+RECORD_KEYS = ['release_year', 'duration', 'direction', 'language', 'country', 'img_thumb', 'img_main']
+
+
+def video_record(article, thumb_template, context):
+    # JSON record of a video, html is the thumbnail of the listing pages
+    record = {
+        'slug': article.slug,
+        'url': article.url,
+        'title': Markup(article.title).striptags(),
+        'summary': Markup(article.summary).striptags(),
+        'year': article.category.slug,
+        'tags': [tag.name for tag in getattr(article, 'tags', [])],
+    }
+    for key in RECORD_KEYS:
+        if key in article.metadata:
+            record[key] = str(article.metadata[key])
+    record['html'] = thumb_template.render({**context, 'article': article}).strip()
+    return record
+
+
+def listings(generator):
+    # {listing: (name, articles)}, the articles in the order of the listing pages
+    out = {'all': ('All videos', generator.articles)}
+    for tag, articles in generator.tags.items():
+        out[f'tags/{tag.slug}'] = (tag.name, articles)
+    for category, articles in generator.categories:
+        out[f'years/{category.slug}'] = (category.name, articles)
+    return out
+
+
+def shard_path(listing, page):
+    return f'{listing}/{page}.json'
+
+
+class ApiWriter:
+    # Writes the JSON files whose content changed since the last build, removes the ones not
+    # generated anymore. The content hash of each file is kept in the state file.
+
+    def __init__(self, output_path, previous):
+        self.output_path = output_path
+        self.previous = previous
+        self.files = {}
+        self.counts = {'written': 0, 'unchanged': 0, 'removed': 0}
+
+    def write(self, relpath, data):
+        content = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        digest = hashlib.sha1(content).hexdigest()
+        self.files[relpath] = digest
+        path = os.path.join(self.output_path, *relpath.split('/'))
+        if self.previous.get(relpath, None) == digest and os.path.isfile(path):
+            self.counts['unchanged'] += 1
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self.counts['written'] += 1
+
+    def remove_stale(self):
+        for relpath in set(self.previous) - set(self.files):
+            path = os.path.join(self.output_path, *relpath.split('/'))
+            if os.path.isfile(path):
+                os.remove(path)
+                self.counts['removed'] += 1
+
+
+def load_state(path, digest):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    # Settings, templates or format changed: the records are built again
+    if state.get('version') != API_VERSION or state.get('digest') != digest:
+        return {'files': state.get('files', {})}
+    return state
+
+
+def article_writer_finalized(generator, writer):
+    # Static JSON API in <output>/RUNNINGIMAGES_API_PATH: a record per video (videos/<slug>.json),
+    # the listings of all the videos, each tag and each year in shards of DEFAULT_PAGINATION
+    # videos (<listing>/<page>.json, linked by their 'next' cursor) and a manifest
+    settings = generator.settings
+    api_path = settings.get('RUNNINGIMAGES_API_PATH', None)
+    if not api_path:
+        return
+    page_size = settings['DEFAULT_PAGINATION'] or len(generator.articles) or 1
+    state_path = os.path.join(settings['CACHE_PATH'], 'runningimages_api.json')
+    digest = incremental.build_digest(settings)
+    state = load_state(state_path, digest)
+    api = ApiWriter(os.path.join(writer.output_path, api_path), state.get('files', {}))
+
+    # Records of the unchanged articles are taken from the state, the others rendered again
+    thumb_template = generator.get_template('article_thumb')
+    cached = state.get('records', {})
+    records = {}
+    for article in generator.articles:
+        article_digest = incremental.article_digest(article)
+        entry = cached.get(article.save_as, None)
+        if entry is None or entry[0] != article_digest:
+            entry = [article_digest, video_record(article, thumb_template, generator.context)]
+        records[article.save_as] = entry
+        api.write(f'videos/{article.slug}.json', entry[1])
+
+    manifest = {'version': API_VERSION, 'page_size': page_size, 'count': len(generator.articles),
+                'videos': 'videos/{slug}.json', 'listings': {}}
+    for listing, (name, articles) in listings(generator).items():
+        pages = max(1, -(-len(articles) // page_size))
+        for page in range(1, pages + 1):
+            items = articles[(page - 1) * page_size:page * page_size]
+            api.write(shard_path(listing, page), {
+                'listing': listing,
+                'page': page,
+                'count': len(articles),
+                'items': [records[article.save_as][1] for article in items],
+                'next': shard_path(listing, page + 1) if page < pages else None,
+            })
+        manifest['listings'][listing] = {'name': name, 'count': len(articles), 'pages': pages, 'first': shard_path(listing, 1)}
+    api.write('manifest.json', manifest)
+    api.remove_stale()
+
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+    with open(state_path, 'w') as f:
+        json.dump({'version': API_VERSION, 'digest': digest, 'records': records, 'files': api.files}, f)
+    logger.info('JSON API: %d files written, %d unchanged, %d removed',
+                api.counts['written'], api.counts['unchanged'], api.counts['removed'])
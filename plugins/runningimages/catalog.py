@@ -0,0 +1,55 @@
+import html
+import json
+import os
+import re
+from pelican.contents import Article
+from pelican.readers import BaseReader, default_metadata
+from pelican.utils import order_content
+
+PARAGRAPH_RE = re.compile(r'\n\s*\n')
+TRAILING_SPACE_RE = re.compile(r'[ \t]+$', re.MULTILINE)
+URL_RE = re.compile(r'https?://[^\s<>]*[^\s<>.,;:!?)\']')
+
+
+def to_html(text):
+    # Same markup as the rst reader output for plain text paragraphs: docutils escapes " and @ too,
+    # drops the trailing spaces of the lines and links the standalone urls
+    text = html.escape(text, quote=False).replace('"', '&quot;').replace('@', '&#64;')
+    text = URL_RE.sub(lambda m: f'<a class="reference external" href="{m.group(0)}">{m.group(0)}</a>', TRAILING_SPACE_RE.sub('', text))
+    return ''.join(f'<p>{paragraph.strip()}</p>\n' for paragraph in PARAGRAPH_RE.split(text) if paragraph.strip())
+
+
+def read_catalog(generator):
+    # Articles from the JSON lines catalog written by create_content.py, no per-video file to parse
+    path = os.path.join(generator.path, generator.settings.get('RUNNINGIMAGES_CATALOG', 'catalog.jsonl'))
+    if not os.path.isfile(path):
+        return []
+
+    reader = BaseReader(generator.settings)
+    articles = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            metadata = default_metadata(settings=generator.settings, process=reader.process_metadata)
+            metadata['title'] = record['title']
+            if record['category']:
+                metadata['category'] = reader.process_metadata('category', record['category'])
+            for key, value in record['metadata'].items():
+                # Formatted fields (summary) are html for the templates, as the rst reader renders them
+                if key in generator.settings['FORMATTED_FIELDS']:
+                    value = to_html(value)
+                metadata[key] = reader.process_metadata(key, value)
+            content = to_html(record['description'])
+            source_path = os.path.join(generator.path, 'videos', record['category'] or '', f'{record["slug"]}.rst')
+            articles.append(Article(content, metadata=metadata, settings=generator.settings,
+                                    source_path=source_path, context=generator.context))
+    return articles
+
+
+def article_generator_pretaxonomy(generator):
+    articles = read_catalog(generator)
+    if not articles:
+        return
+    for article in articles:
+        generator.add_source_path(article)
+    generator.articles = order_content(generator.articles + articles, generator.settings['ARTICLE_ORDER_BY'])
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+from pelican.writers import Writer
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the state file format changes
+STATE_VERSION = 2
+
+_static_outputs = []
+_writer = {'current': None}
+
+
+def jsonable(value):
+    # Settings without the values that can't be compared from one run to the next (functions, modules...)
+    if isinstance(value, dict):
+        return {str(k): jsonable(v) for k, v in value.items() if jsonable(v) is not None}
+    if isinstance(value, (list, tuple, set)):
+        return [jsonable(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return None
+
+
+def files_digest(h, dirpath, extensions):
+    for root, dirnames, filenames in sorted(os.walk(dirpath)):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if os.path.splitext(fname)[1] in extensions:
+                path = os.path.join(root, fname)
+                h.update(os.path.relpath(path, dirpath).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+
+
+def build_digest(settings):
+    # Anything but the content that changes the rendered pages: settings, theme templates, this plugin
+    h = hashlib.sha1(str(STATE_VERSION).encode('utf-8'))
+    h.update(json.dumps(jsonable(settings), sort_keys=True).encode('utf-8'))
+    files_digest(h, os.path.join(settings['THEME'], 'templates'), {'.html'})
+    files_digest(h, os.path.dirname(__file__), {'.py'})
+    return h.hexdigest()
+
+
+def article_digest(article):
+    # What an article page, and the listings it appears in, show of the article
+    data = {key: str(value) for key, value in article.metadata.items()}
+    data['content'] = getattr(article, '_content', '')
+    data['url'] = article.url
+    data['info_items'] = getattr(article, 'info_items', None)
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def page_dependencies(context):
+    # Articles a page is rendered from: the article and its related videos, the articles of a
+    # listing page, None for the pages that are always rendered
+    if 'article' in context:
+        article = context['article']
+        return [article] + list(getattr(article, 'related_articles', []))
+    if 'page' in context:
+        return None
+    if 'articles_page' in context:
+        return list(context['articles_page'].object_list)
+    return list(context.get('articles', []))
+
+
+def page_key(context, deps):
+    # What the page is rendered from: its articles, and for the paginated listings the page count
+    # (pagination.html links the last page and the next ones)
+    paginator = context.get('articles_paginator', None)
+    return {
+        'articles': [article.save_as for article in deps],
+        'num_pages': paginator.num_pages if paginator is not None else None,
+    }
+
+
+class IncrementalTemplate:
+    # Renders only when the page is not up to date in the output directory, an up to date page
+    # gets its current output back: Pelican writes the same file again
+
+    def __init__(self, template, writer):
+        self.template = template
+        self.writer = writer
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context):
+        if self.writer.is_up_to_date(context):
+            with open(self.writer.output_file(context), encoding='utf-8') as f:
+                return f.read()
+        return self.template.render(context)
+
+
+class IncrementalWriter(Writer):
+    # Pelican writer skipping the pages whose articles did not change since the last build.
+    # The state file keeps, for each page, the articles it was rendered from and their digests.
+
+    def __init__(self, output_path, settings=None):
+        super().__init__(output_path, settings=settings)
+        self.state_path = settings.get('RUNNINGIMAGES_INCREMENTAL_STATE') or os.path.join(settings['CACHE_PATH'], 'runningimages_incremental.json')
+        self.previous = {}
+        if os.path.isfile(self.state_path):
+            with open(self.state_path) as f:
+                self.previous = json.load(f)
+        self.digest = build_digest(settings)
+        # Full build when the settings, the theme or the output directory changed
+        self.full = self.previous.get('version') != STATE_VERSION or self.previous.get('digest') != self.digest \
+            or self.previous.get('output_path') != os.path.abspath(output_path)
+        if self.full:
+            self.previous = {}
+        self.digests = {}
+        self.pages = {}
+        self.counts = {'rendered': 0, 'unchanged': 0, 'removed': 0}
+        _writer['current'] = self
+
+    def article_digest(self, article):
+        key = article.save_as
+        if key not in self.digests:
+            self.digests[key] = article_digest(article)
+        return self.digests[key]
+
+    def output_file(self, context):
+        return os.path.abspath(os.path.join(self.output_path, context['output_file']))
+
+    def is_up_to_date(self, context):
+        name = context['output_file']
+        path = self.output_file(context)
+        deps = page_dependencies(context)
+        if deps is None:
+            self.counts['rendered'] += 1
+            return False
+        self.pages[name] = page_key(context, deps)
+        digests = self.previous.get('digests', {})
+        if os.path.isfile(path) and self.previous.get('pages', {}).get(name, None) == self.pages[name] \
+                and all(digests.get(article.save_as, None) == self.article_digest(article) for article in deps):
+            self.counts['unchanged'] += 1
+            return True
+        for article in deps:
+            self.article_digest(article)
+        self.counts['rendered'] += 1
+        return False
+
+    def write_file(self, name, template, context, *args, **kwargs):
+        # Pages of paginated listings are only known from write_file: the check is done per page,
+        # when their template is rendered
+        return super().write_file(name, IncrementalTemplate(template, self), context, *args, **kwargs)
+
+    def finalize(self):
+        # Remove the outputs of the pages and static files not generated anymore, save the state
+        for name in set(self.previous.get('pages', {})) - set(self.pages):
+            self.remove_output(name)
+        for name in set(self.previous.get('static', [])) - set(_static_outputs):
+            self.remove_output(name)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        with open(self.state_path, 'w') as f:
+            json.dump({
+                'version': STATE_VERSION,
+                'digest': self.digest,
+                'output_path': os.path.abspath(self.output_path),
+                'digests': self.digests,
+                'pages': self.pages,
+                'static': sorted(_static_outputs),
+            }, f)
+        logger.info('Incremental build%s: %d pages rendered, %d unchanged, %d removed',
+                    ' (full)' if self.full else '', self.counts['rendered'], self.counts['unchanged'], self.counts['removed'])
+
+    def remove_output(self, name):
+        path = os.path.abspath(os.path.join(self.output_path, name))
+        if os.path.isfile(path):
+            os.remove(path)
+            self.counts['removed'] += 1
+            logger.info('Removed "%s"', path)
+
+
+def get_writer(pelican):
+    if not pelican.settings.get('RUNNINGIMAGES_INCREMENTAL', False):
+        _writer['current'] = None
+        return None
+    return IncrementalWriter
+
+
+def static_generator_finalized(generator):
+    _static_outputs[:] = [static.save_as for static in generator.staticfiles]
+
+
+def finalized(pelican):
+    if _writer['current'] is not None:
+        _writer['current'].finalize()
+        _writer['current'] = None
@@ -2,32 +2,55 @@ import os
 import json
 from pelican import signals
 
+from .catalog import article_generator_pretaxonomy
+from . import api, incremental
 
-def article_generator_write_article(article_generator, content):
-    # Extract people, event, sponsors, production, direction
-    article_tags = dict((tag.name, tag.url) for tag in content.metadata.get('tags', []))
-
-    article_info = {
-        'people': [],
-        'events': [],
-        'sponsors': [],
-        'production': [],
-        'direction': []
+INFO_KEYS = ['people', 'events', 'sponsors', 'production', 'direction']
+
+
+def keyword_index(generator):
+    # {keyword type: {name: tag url}}, built once for all the articles
+    tag_urls = dict((tag.name, tag.url) for tag in generator.tags)
+    tag_types = generator.settings.get('TAG_TYPES', {})
+    return {
+        key: dict((name, tag_urls[name]) for name in tag_types.get(key, []) if name in tag_urls)
+        for key in INFO_KEYS
     }
 
-    for key in article_info.keys():
-        if key not in content.metadata:
-            continue
-        for name in content.metadata[key].split(';'):
-            article_info[key].append({'name': name, 'url': article_tags.get(name, None)})
 
-    content.info_items = article_info
+def set_info_items(article, index, separator):
+    # Extract people, event, sponsors, production, direction
+    article_info = {}
+    for key in INFO_KEYS:
+        names = article.metadata[key].split(separator) if key in article.metadata else []
+        article_info[key] = [{'name': name, 'url': index[key].get(name, None)} for name in names]
+
+    article.info_items = article_info
 
     # Flatten all info fields to generate the keywords (using in meta & page title)
-    content.keywords = ', '.join(item['name'] for items in article_info.values() for item in items)
+    article.keywords = ', '.join(item['name'] for items in article_info.values() for item in items)
 
 
-def register():
-    signals.article_generator_write_article.connect(article_generator_write_article)
+def set_related_articles(article, by_slug, separator):
+    # Related videos are computed by create_content.py, listed by slug
+    slugs = article.metadata['related'].split(separator) if 'related' in article.metadata else []
+    article.related_articles = [by_slug[slug] for slug in slugs if slug in by_slug]
+
 
+def article_generator_finalized(generator):
+    index = keyword_index(generator)
+    by_slug = dict((article.slug, article) for article in generator.articles)
+    separator = generator.settings.get('RUNNINGIMAGES_TAG_SEPARATOR', ', ')
+    for attr in ['articles', 'translations', 'drafts', 'drafts_translations', 'hidden_articles', 'hidden_translations']:
+        for article in getattr(generator, attr, []):
+            set_info_items(article, index, separator)
+            set_related_articles(article, by_slug, separator)
 
+
+def register():
+    signals.article_generator_pretaxonomy.connect(article_generator_pretaxonomy)
+    signals.article_generator_finalized.connect(article_generator_finalized)
+    signals.article_writer_finalized.connect(api.article_writer_finalized)
+    signals.static_generator_finalized.connect(incremental.static_generator_finalized)
+    signals.get_writer.connect(incremental.get_writer)
+    signals.finalized.connect(incremental.finalized)
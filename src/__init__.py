@@ -28,9 +28,104 @@ LANG_MAP = {
     'gr': 'Greek'
 }
 
-IMG_FORMATS = ['jpg']
+IMG_FORMATS = ['jpg', 'jpeg', 'gif', 'png']
+
+# Image downloads: worker threads and simultaneous connections per host
+DOWNLOAD_WORKERS = 8
+DOWNLOAD_HOST_LIMIT = 4
+DOWNLOAD_HOST_LIMITS = {
+    'i.ytimg.com': 6,
+    'i.vimeocdn.com': 4,
+}
+# (connect, read) timeouts, attempts after a failure with exponential backoff, streaming chunk size
+DOWNLOAD_TIMEOUT = (5, 30)
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 1.0
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Responsive derivatives of the downloaded images (content/images/derived): widths by image kind, encoders settings
+IMG_DERIVED_DIR = 'derived'
+IMG_DERIVED_WIDTHS = {
+    'thumb': [128, 256],
+    'main': [480, 960, 1440],
+}
+IMG_DERIVED_FORMATS = ['avif', 'webp', 'jpeg']
+IMG_DERIVED_QUALITY = {'avif': 55, 'webp': 78, 'jpeg': 82}
+IMG_DERIVED_WORKERS = os.cpu_count() or 1
 
 TAG_SEPARATOR = ', '
 
+# Related videos per page, and number of videos scored at once
+RELATED_COUNT = 4
+RELATED_CHUNK_SIZE = 2000
+
+# Static search index: term weight by field (keyword fields use 'keywords'), shards by the first characters of the terms
+SEARCH_WEIGHTS = {'title': 3, 'keywords': 2, 'summary': 1}
+SEARCH_PREFIX_LENGTH = 2
+
+# Generated site files minified (html, css) and precompressed (.gz, and .br when brotli is installed)
+COMPRESS_EXTENSIONS = ['.html', '.css', '.js', '.json', '.xml', '.svg', '.txt']
+COMPRESS_WORKERS = os.cpu_count() or 1
+
+# Releases kept on the deploy target, for rollbacks
+DEPLOY_KEEP_RELEASES = 3
+
+# Link checks are cached for LINK_CHECK_TTL seconds (transient errors are not cached)
+LINK_CHECK_TTL = 7 * 24 * 3600
+
+# 'catalog': all videos in content/catalog.jsonl, read by the runningimages plugin
+# 'rst': one reStructuredText page per video in content/videos
+CONTENT_FORMAT = 'catalog'
+
 BASEDIR = os.path.join(os.path.dirname(__file__), '..')
 
+CACHE_DIR = os.path.join(BASEDIR, '.cache')
+
+# Logical image names (<slug_fs>.main, <slug_fs>.thumb) to files of content/images, committed with
+# them (as sitemeta.json) so that a fresh clone resolves the hashed files without downloading them again
+IMAGE_INDEX_PATH = os.path.join(BASEDIR, 'imagemeta.json')
+
+# Local snapshot of the spreadsheet, with the sheet modified time it was taken at
+SHEET_NAME = 'Running Images'
+SHEET_SNAPSHOT_PATH = os.path.join(CACHE_DIR, 'sheet.parquet')
+SHEET_SNAPSHOT_META_PATH = os.path.join(CACHE_DIR, 'sheet.json')
+
+# Provider (youtube, vimeo) API responses cache
+API_CACHE_PATH = os.path.join(CACHE_DIR, 'api.sqlite')
+API_CACHE_TTL = 30 * 24 * 3600
+API_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# JSON timings and counters of the last create_content run
+RUN_REPORT_PATH = os.path.join(CACHE_DIR, 'run_report.json')
+
+CATALOG_PATH = os.path.join(BASEDIR, 'content', 'catalog.jsonl')
+
+# Source hashes and outputs of the image derivatives
+IMG_DERIVED_MANIFEST_PATH = os.path.join(CACHE_DIR, 'image_derivatives.json')
+
+# Content hashes of the compressed site files, and their minified & compressed versions
+COMPRESS_MANIFEST_PATH = os.path.join(CACHE_DIR, 'compress.json')
+COMPRESS_CACHE_DIR = os.path.join(CACHE_DIR, 'compress')
+
+# Status of the stream, trailer and official links of the last check
+LINK_REPORT_PATH = os.path.join(CACHE_DIR, 'link_report.json')
+
+# Violations of the sheet schema found by the last run, empty when the sheet is valid
+SCHEMA_REPORT_PATH = os.path.join(CACHE_DIR, 'schema_report.json')
+
+# Files of the last successful deploy, one manifest per target
+DEPLOY_MANIFEST_DIR = os.path.join(CACHE_DIR, 'deploy')
+
+SEARCH_DIR = os.path.join(BASEDIR, 'content', 'search')
+
+# Content hashes of the generated video pages, by slug_fs
+CONTENT_MANIFEST_PATH = os.path.join(CACHE_DIR, 'content_manifest.json')
+
+# Results of the create_content.py stages, read by the next stage
+STAGES_DIR = os.path.join(CACHE_DIR, 'stages')
+
+
+def isnull(value):
+    # Missing sheet value: NaN, NaT or None. Values read back from a persisted stage are not the
+    # np.nan object anymore, 'is np.nan' can't be used.
+    return value is None or (not isinstance(value, (str, list, dict)) and value != value)
@@ -0,0 +1,82 @@
+import sqlite3
+import json
+import os
+import time
+
+from . import *
+from . import stats
+
+
+class ApiCache:
+    # Provider API payloads keyed by (provider, vid), with per-entry expiry and LRU eviction by size
+
+    def __init__(self, path=API_CACHE_PATH, ttl=API_CACHE_TTL, max_bytes=API_CACHE_MAX_BYTES, refresh=False):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+            provider TEXT NOT NULL,
+            vid TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            expires REAL NOT NULL,
+            accessed REAL NOT NULL,
+            PRIMARY KEY (provider, vid)
+        )''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, provider, vid):
+        row = None
+        if not self.refresh:
+            row = self.db.execute(
+                'SELECT payload FROM responses WHERE provider = ? AND vid = ? AND expires > ?',
+                (provider, vid, time.time())).fetchone()
+        if row is None:
+            self.misses += 1
+            stats.incr('api_cache.misses')
+            return None
+        self.hits += 1
+        stats.incr('api_cache.hits')
+        self.db.execute('UPDATE responses SET accessed = ? WHERE provider = ? AND vid = ?', (time.time(), provider, vid))
+        return json.loads(row[0])
+
+    def set(self, provider, vid, payload, ttl=None):
+        data = json.dumps(payload)
+        now = time.time()
+        self.db.execute(
+            'INSERT OR REPLACE INTO responses (provider, vid, payload, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)',
+            (provider, vid, data, len(data), now + (ttl if ttl is not None else self.ttl), now))
+
+    def evict(self):
+        # Drop expired entries, then the least recently used ones until the cache fits in max_bytes
+        evicted = self.db.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),)).rowcount
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total > self.max_bytes:
+            stale = []
+            for provider, vid, size in self.db.execute('SELECT provider, vid, size FROM responses ORDER BY accessed'):
+                if total <= self.max_bytes:
+                    break
+                stale.append((provider, vid))
+                total -= size
+            self.db.executemany('DELETE FROM responses WHERE provider = ? AND vid = ?', stale)
+            evicted += len(stale)
+        return evicted
+
+    def stats(self):
+        entries, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def close(self):
+        self.evict()
+        self.db.commit()
+        self.db.close()
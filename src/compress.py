@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from . import *
+
+PRESERVE_RE = re.compile(r'<(pre|textarea|script|style)\b.*?</\1\s*>', re.S | re.I)
+HTML_COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+STYLE_RE = re.compile(r'(<style\b[^>]*>)(.*?)(</style\s*>)', re.S | re.I)
+# Kept as they are (group 1) or removed (comments)
+CSS_TOKEN_RE = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|url\(\s*[^'"\s)][^)]*\))|/\*(?!!).*?\*/''', re.S | re.I)
+
+
+def collapse_whitespace(text):
+    # Browsers render any whitespace run as a single space: keep one character, a newline if there was one
+    return re.sub(r'\s+', lambda m: '\n' if '\n' in m.group(0) else ' ', text)
+
+
+def minify_html(text):
+    # Whitespace and comments outside of <pre>, <textarea>, <script> and <style>, inline stylesheets minified
+    out = []
+    pos = 0
+    for m in PRESERVE_RE.finditer(text):
+        out.append(collapse_whitespace(HTML_COMMENT_RE.sub('', text[pos:m.start()])))
+        block = m.group(0)
+        if m.group(1).lower() == 'style':
+            block = STYLE_RE.sub(lambda s: s.group(1) + minify_css(s.group(2)) + s.group(3), block)
+        out.append(block)
+        pos = m.end()
+    out.append(collapse_whitespace(HTML_COMMENT_RE.sub('', text[pos:])))
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css_code(text):
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    return text.replace(';}', '}')
+
+
+def minify_css(text):
+    # Comments (but /*! ones) and whitespace around punctuation. Strings and unquoted url() are
+    # found in the same left to right scan as the comments: a /* inside them is not a comment.
+    out = []
+    code = []
+    pos = 0
+    for m in CSS_TOKEN_RE.finditer(text):
+        code.append(text[pos:m.start()])
+        pos = m.end()
+        if m.group(1) is not None:
+            out.append(minify_css_code(''.join(code)))
+            out.append(m.group(1))
+            code = []
+    code.append(text[pos:])
+    out.append(minify_css_code(''.join(code)))
+    return ''.join(out).strip()
+
+
+MINIFIERS = {'.html': minify_html, '.css': minify_css}
+
+
+def encodings(precompress=True):
+    # Precompressed siblings written next to each file
+    if not precompress:
+        return []
+    return ['gz', 'br'] if brotli is not None else ['gz']
+
+
+def compress_file(job):
+    # Minify the file in place and write its precompressed siblings, a copy of each result is kept
+    # in the cache under the hash of the original content. Runs in the worker processes.
+    path, raw_hash, cache_dir, suffixes = job
+    ext = os.path.splitext(path)[1]
+    with open(path, 'rb') as f:
+        data = f.read()
+    if ext in MINIFIERS:
+        data = MINIFIERS[ext](data.decode('utf-8')).encode('utf-8')
+    outputs = {'': data}
+    if 'gz' in suffixes:
+        outputs['gz'] = gzip.compress(data, compresslevel=9, mtime=0)
+    if 'br' in suffixes:
+        outputs['br'] = brotli.compress(data, quality=11)
+    for suffix, content in outputs.items():
+        for target in [path + (f'.{suffix}' if suffix else ''), os.path.join(cache_dir, f'{raw_hash}.{suffix or "min"}')]:
+            tmp_path = f'{target}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, target)
+    return hashlib.sha1(data).hexdigest()
+
+
+def load_compress_manifest(output_path):
+    if not os.path.isfile(COMPRESS_MANIFEST_PATH):
+        return {}
+    with open(COMPRESS_MANIFEST_PATH) as f:
+        manifest = json.load(f)
+    # Manifest of another output directory
+    if manifest.get('output_path') != os.path.abspath(output_path):
+        return {}
+    return manifest['files']
+
+
+def compress_site(output_path, workers=COMPRESS_WORKERS, precompress=True):
+    # Minify HTML & CSS and precompress the text files of the generated site. Files whose content
+    # is the one processed last time are skipped, files regenerated with the same content as
+    # before (full builds) are restored from the cache. precompress=False: minify only, for hosts
+    # that do not serve the .gz/.br siblings (the existing ones are removed).
+    manifest = load_compress_manifest(output_path)
+    os.makedirs(COMPRESS_CACHE_DIR, exist_ok=True)
+    cached = set(os.listdir(COMPRESS_CACHE_DIR))
+    suffixes = encodings(precompress)
+
+    files = {}
+    siblings = []
+    for root, dirnames, filenames in os.walk(output_path):
+        for fname in filenames:
+            path = os.path.join(root, fname)
+            relpath = os.path.relpath(path, output_path)
+            ext = os.path.splitext(fname)[1]
+            if ext[1:] in ('gz', 'br'):
+                siblings.append(path)
+            elif ext in COMPRESS_EXTENSIONS:
+                files[relpath] = path
+
+    new_manifest = {}
+    todo = []
+    counts = {'compressed': 0, 'restored': 0, 'unchanged': 0, 'removed': 0}
+    for relpath, path in sorted(files.items()):
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        entry = manifest.get(relpath, None)
+        has_siblings = all(os.path.isfile(f'{path}.{suffix}') for suffix in suffixes)
+        if entry is not None and entry['output'] == digest and has_siblings:
+            new_manifest[relpath] = entry
+            counts['unchanged'] += 1
+        elif all(f'{digest}.{suffix}' in cached for suffix in ['min'] + suffixes):
+            # Regenerated as it was before: same output as last time
+            for suffix in ['min'] + suffixes:
+                shutil.copyfile(os.path.join(COMPRESS_CACHE_DIR, f'{digest}.{suffix}'), path if suffix == 'min' else f'{path}.{suffix}')
+            with open(path, 'rb') as f:
+                new_manifest[relpath] = {'source': digest, 'output': hashlib.sha1(f.read()).hexdigest()}
+            counts['restored'] += 1
+        else:
+            todo.append((relpath, path, digest))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(compress_file, [(path, digest, COMPRESS_CACHE_DIR, suffixes) for relpath, path, digest in todo], chunksize=16)
+        for (relpath, path, digest), output in zip(todo, results):
+            new_manifest[relpath] = {'source': digest, 'output': output}
+            counts['compressed'] += 1
+
+    # Siblings of files that are gone or of an encoding not wanted, cache entries of content not in the site anymore
+    paths = set(files.values())
+    for path in siblings:
+        base, ext = os.path.splitext(path)
+        if os.path.splitext(base)[1] in COMPRESS_EXTENSIONS and (base not in paths or ext[1:] not in suffixes):
+            os.remove(path)
+            counts['removed'] += 1
+    sources = {entry['source'] for entry in new_manifest.values()}
+    for fname in os.listdir(COMPRESS_CACHE_DIR):
+        if fname.split('.', 1)[0] not in sources:
+            os.remove(os.path.join(COMPRESS_CACHE_DIR, fname))
+
+    with open(COMPRESS_MANIFEST_PATH, 'w') as f:
+        json.dump({'output_path': os.path.abspath(output_path), 'files': new_manifest}, f, indent=2, sort_keys=True)
+    print(f"Compressed files: {counts['compressed']} compressed, {counts['restored']} restored, "
+          f"{counts['unchanged']} unchanged, {counts['removed']} stale siblings removed ({', '.join(suffixes) or 'minified only'})")
+    return counts
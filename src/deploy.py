@@ -0,0 +1,183 @@
+import datetime
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+
+from . import *
+
+# Never deployed
+EXCLUDES = {'.DS_Store'}
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def scan_site(output_path, previous=None):
+    # {relpath: {'hash', 'size', 'mtime_ns'}} of the site files. Files whose size and mtime are the
+    # ones of the previous scan are not hashed again.
+    previous = previous or {}
+    files = {}
+    for root, dirnames, filenames in os.walk(output_path):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname in EXCLUDES:
+                continue
+            path = os.path.join(root, fname)
+            relpath = '/'.join(os.path.relpath(path, output_path).split(os.sep))
+            st = os.stat(path)
+            entry = previous.get(relpath, None)
+            if entry is not None and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+                digest = entry['hash']
+            else:
+                digest = file_hash(path)
+            files[relpath] = {'hash': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    return files
+
+
+def diff_files(previous, files):
+    return {
+        'added': sorted(set(files) - set(previous)),
+        'changed': sorted(path for path in set(files) & set(previous) if files[path]['hash'] != previous[path]['hash']),
+        'removed': sorted(set(previous) - set(files)),
+    }
+
+
+def manifest_path(target):
+    return os.path.join(DEPLOY_MANIFEST_DIR, hashlib.sha1(target.encode('utf-8')).hexdigest()[:16] + '.json')
+
+
+def load_deploy_manifest(target):
+    # Files of the last successful deploy to target
+    path = manifest_path(target)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)['files']
+
+
+def save_deploy_manifest(target, release, files):
+    path = manifest_path(target)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'target': target, 'release': release, 'files': files}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+class LocalTarget:
+    # Releases in <path>/releases/<name>, <path>/current is a symlink to the live one.
+    # Unchanged files are hard links to the previous release.
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+
+    def current(self):
+        current = os.path.join(self.path, 'current')
+        return os.path.realpath(current) if os.path.isdir(current) else None
+
+    def create_release(self, name, output_path, files, changes):
+        current = self.current()
+        release = os.path.join(self.path, 'releases', name)
+        copied = set(changes['added']) | set(changes['changed'])
+        for relpath in files:
+            target = os.path.join(release, *relpath.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            linked = os.path.join(current, *relpath.split('/')) if current is not None and relpath not in copied else None
+            if linked is not None and os.path.isfile(linked):
+                os.link(linked, target)
+            else:
+                # New or changed file, or missing from the live release (removed by hand, partial release)
+                shutil.copy2(os.path.join(output_path, *relpath.split('/')), target)
+
+    def switch(self, name):
+        # Atomic: the new symlink replaces the old one in a single rename
+        tmp_path = os.path.join(self.path, f'.current.{name}')
+        os.symlink(os.path.join('releases', name), tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, 'current'))
+
+    def prune(self, keep):
+        releases = sorted(os.listdir(os.path.join(self.path, 'releases')))
+        current = os.path.basename(self.current())
+        for name in releases[:-keep]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.path, 'releases', name))
+
+
+class SshTarget:
+    # Same layout as LocalTarget on a host reached with ssh, the changed files are sent with rsync
+
+    def __init__(self, target, port=22):
+        self.host, self.path = target.split(':', 1)
+        self.port = str(port)
+
+    def run(self, script, stdin=None):
+        subprocess.run(['ssh', '-p', self.port, self.host, script], input=stdin, check=True)
+
+    def current(self):
+        result = subprocess.run(['ssh', '-p', self.port, self.host, f'readlink {shlex.quote(self.path)}/current || true'],
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip() or None
+
+    def create_release(self, name, output_path, files, changes):
+        path = shlex.quote(self.path)
+        release = f'releases/{name}'
+        # Hard link copy of the live release, then remove the files that are gone
+        self.run(f'set -e; cd {path}; mkdir -p {release}; if [ -d current ]; then cp -al current/. {release}/; fi; '
+                 f'cd {release}; xargs -0 -r rm -f --; find . -mindepth 1 -type d -empty -delete',
+                 stdin='\0'.join(changes['removed']).encode('utf-8'))
+        # rsync writes new files before renaming them: the hard links of the live release are not modified
+        subprocess.run(['rsync', '-pthz', '--files-from=-', '-e', f'ssh -p {self.port}',
+                        output_path.rstrip('/') + '/', f'{self.host}:{self.path}/{release}/'],
+                       input='\n'.join(changes['added'] + changes['changed']).encode('utf-8'), check=True)
+
+    def switch(self, name):
+        self.run(f'set -e; cd {shlex.quote(self.path)}; ln -sfn releases/{name} .current.{name}; mv -Tf .current.{name} current')
+
+    def prune(self, keep):
+        self.run(f'cd {shlex.quote(self.path)}/releases && ls -1 | sort | head -n -{keep} | grep -vxF "$(basename "$(readlink ../current)")" | xargs -r rm -rf --')
+
+
+def deploy_target(target, port=22):
+    # user@host:path is a remote target, anything else a local directory
+    if ':' in target and not os.path.isabs(target) and not os.path.exists(target):
+        return SshTarget(target, port)
+    return LocalTarget(target)
+
+
+def deploy(output_path, target, port=22, full=False, dry_run=False, keep=DEPLOY_KEEP_RELEASES):
+    # Upload the files added or changed since the last successful deploy to target in a new
+    # release, then switch the live release to it. full: ignore the last deploy, upload everything.
+    previous = {} if full else load_deploy_manifest(target)
+    files = scan_site(output_path, previous)
+    changes = diff_files(previous, files)
+    print(f"Deploy to {target}: {len(changes['added'])} added, {len(changes['changed'])} changed, "
+          f"{len(changes['removed'])} removed, {len(files) - len(changes['added']) - len(changes['changed'])} unchanged")
+    if dry_run:
+        for kind, paths in changes.items():
+            for relpath in paths:
+                print(f'{kind:>8} {relpath}')
+        return changes
+
+    dest = deploy_target(target, port)
+    if previous and not any(changes.values()):
+        print('Nothing to deploy')
+        return changes
+    if full or dest.current() is None:
+        # Nothing to link from: every file is sent
+        changes = {'added': sorted(files), 'changed': [], 'removed': []}
+
+    name = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d%H%M%S%f')
+    dest.create_release(name, output_path, files, changes)
+    dest.switch(name)
+    dest.prune(keep)
+    save_deploy_manifest(target, name, files)
+    print(f'Deployed release {name}')
+    return changes
@@ -1,13 +1,12 @@
 import shutil
 import os
-import logging
-import numpy as np
 import re
 import textwrap
 import json
-from .media import parse_stream_url
+import hashlib
 
 from . import *
+from . import stats
 
 
 def clean_content():
@@ -37,66 +36,32 @@ def format_duration(tt):
 
 
 def media_metas(video):
-    # Generate video links
-    player = None
-    link_vod = None
-    link_fm = None
-
-    free = video['free_access'] if video['free_access'] is not np.NaN else False
-
-    def qualify_stream(link):
-        if link is np.NaN:
-            return {'type': 'no_link'}
-        linfo = parse_stream_url(link, link)
-        if linfo is None:
-            return {'type': 'unsupported'}
-        return linfo
-    link_stream = qualify_stream(video['link_stream'])
-    link_trailer = qualify_stream(video['link_trailer'])
-
-    if not free:
-        # S'il y a un lien de stream, proposer comme VOD
-        if link_stream['type'] != 'no_link':
-            link_vod = video['link_stream']
-        # Si le lien trailer est supporté, le mettre dans le player, sinon on ignore
-        if link_trailer['type'] not in ['no_link', 'unsupported']:
-            player = link_trailer
-    else:
-        # stream supporté => player
-        if link_stream['type'] not in ['no_link', 'unsupported']:
-            player = link_stream
-        # Stream non supporté => lien full movie
-        if link_stream['type'] == 'unsupported':
-            link_fm = video['link_stream']
-        # trailer supporté et rien dans le player => trailer dans le player
-        if link_trailer['type'] not in ['no_link', 'unsupported'] and player is None:
-            player = link_trailer
-
-    out = {}
-    if player is not None:
-        out['player_vid'] = player['vid']
-        out['player_type'] = player['type']
-        out['player_url'] = player['url'].geturl()
-    if link_vod is not None:
-        out['link_vod'] = link_vod
-    if link_fm is not None:
-        out['link_fm'] = link_fm
-
-    return out
-
-
-def video_build_metadata(video, keywords, images):
+    # Player & link metadata of the video page, classified for all videos at once by streams.add_media_metas
+    if 'media_metas' not in video:
+        add_missing_media_metas([video])
+    return video['media_metas']
+
+
+def add_missing_media_metas(videos):
+    # Videos of a persisted stage already have their media_metas, pandas is only imported when some are missing
+    missing = [video for video in videos if 'media_metas' not in video]
+    if missing:
+        from .streams import add_media_metas
+        add_media_metas(missing)
+
+
+def video_build_metadata(video, keywords, images, derivatives=None):
     metas = {}
     metas['slug'] = video['slug_web']
     metas['date'] = video['created'].strftime('%Y-%m-%d')
     # metas['category'] = video['category']
     metas['summary'] = textwrap.shorten(video['description'], width=SUMMARY_LENGTH, placeholder="...")
     metas['release_year'] = video['release_year']
-    if video['duration'] is not np.NaN:
+    if not isnull(video['duration']):
         metas['duration'] = format_duration(video['duration'])
-    if video['language'] is not np.NaN:
+    if not isnull(video['language']):
         metas['language'] = video['language']
-    if video['country'] is not np.NaN:
+    if not isnull(video['country']):
         metas['country'] = video['country']
 
     if images is not None:
@@ -110,18 +75,29 @@ def video_build_metadata(video, keywords, images):
             if img_main is None:
                 metas['img_main'] = f'images/{img_thumb}'
 
+    # srcset of the responsive derivatives, per image kind and format
+    if derivatives is not None:
+        for kind, outputs in derivatives.items():
+            for fmt in IMG_DERIVED_FORMATS:
+                srcset = [f"images/{out['path']} {out['width']}w" for out in outputs if out['format'] == fmt]
+                if srcset:
+                    metas[f'img_{kind}_{fmt}'] = ', '.join(srcset)
+
     metas.update(media_metas(video))
 
-    if video['link_official'] is not np.NaN:
+    if not isnull(video['link_official']) and video['link_official'] not in video.get('dead_links', []):
         metas['link_official'] = video['link_official']
 
     for key in keywords.keys():
-        if video[key] is not np.NaN:
+        if not isnull(video[key]):
             metas[key] = TAG_SEPARATOR.join(video[key])
 
+    if video.get('related'):
+        metas['related'] = TAG_SEPARATOR.join(video['related'])
+
     tags = []
     for name, info in keywords.items():
-        if video[name] is np.NaN: continue
+        if isnull(video[name]): continue
         tags += [elem for elem in video[name] if info.get(elem, {}).get('is_tag', False)]
     if tags:
         metas['tags'] = TAG_SEPARATOR.join(tags)
@@ -129,13 +105,13 @@ def video_build_metadata(video, keywords, images):
     return metas
 
 
-def to_video_page(video, keywords, images):
+def to_video_page(video, keywords, images, derivatives=None):
 
     out = [video['title']]
     out.append('#'*len(video['title']))
     out.append('')
 
-    for key, value in video_build_metadata(video, keywords, images).items():
+    for key, value in video_build_metadata(video, keywords, images, derivatives).items():
         out.append(f":{key}: {value}")
 
     out.append('')
@@ -145,27 +121,153 @@ def to_video_page(video, keywords, images):
     return '\n'.join(out)
 
 
-def build_site_content(videos, keywords, images):
-    clean_content()
+def load_content_manifest():
+    if not os.path.isfile(CONTENT_MANIFEST_PATH):
+        return {}
+    with open(CONTENT_MANIFEST_PATH) as f:
+        return json.load(f)
 
-    for video in videos:
-        content = to_video_page(video, keywords, images.get(video['slug_fs'], None))
 
-        if video['category'] is not np.NaN:
-            filepath = os.path.join(BASEDIR, 'content', 'videos', video['category'], f"{video['slug_fs']}.rst")
+def save_content_manifest(manifest):
+    os.makedirs(os.path.dirname(CONTENT_MANIFEST_PATH), exist_ok=True)
+    with open(CONTENT_MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def video_page_path(video):
+    # Page path, relative to content/videos
+    if not isnull(video['category']):
+        return os.path.join(video['category'], f"{video['slug_fs']}.rst")
+    return f"{video['slug_fs']}.rst"
+
+
+def write_video_pages(videos, keywords, images, derivatives=None, clean=False):
+    # One reStructuredText page per video in content/videos/<category>/
+    articles_path = os.path.join(BASEDIR, 'content', 'videos')
+    if clean:
+        clean_content()
+        save_content_manifest({})
+
+    manifest = load_content_manifest()
+    existing = set()
+    for dirpath, dirnames, filenames in os.walk(articles_path):
+        existing.update(os.path.relpath(os.path.join(dirpath, fname), articles_path) for fname in filenames if fname.endswith('.rst'))
+
+    # Only write the pages that are new or whose content changed
+    new_manifest = {}
+    counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+    for video in videos:
+        content = to_video_page(video, keywords, images.get(video['slug_fs'], None), (derivatives or {}).get(video['slug_fs'], None))
+        relpath = video_page_path(video)
+        entry = {'path': relpath, 'hash': hashlib.sha1(content.encode('utf-8')).hexdigest()}
+        new_manifest[video['slug_fs']] = entry
+
+        filepath = os.path.join(articles_path, relpath)
+        if relpath in existing:
+            if manifest.get(video['slug_fs'], None) == entry:
+                counts['unchanged'] += 1
+                continue
+            # Page not in manifest: compare with what is on disk
+            with open(filepath) as f:
+                if f.read() == content:
+                    counts['unchanged'] += 1
+                    continue
+            counts['changed'] += 1
         else:
-            filepath = os.path.join(BASEDIR, 'content', 'videos', f"{video['slug_fs']}.rst")
+            counts['added'] += 1
+
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
         with open(filepath, 'w') as f:
             f.write(content)
-    print(f'Wrote {len(videos)} video files')
+
+    # Remove pages for videos that are gone or changed category
+    for relpath in existing - set(entry['path'] for entry in new_manifest.values()):
+        os.remove(os.path.join(articles_path, relpath))
+        counts['removed'] += 1
+        dirpath = os.path.dirname(os.path.join(articles_path, relpath))
+        if dirpath != articles_path and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+    save_content_manifest(new_manifest)
+    print(f"Video files: {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed, {counts['unchanged']} unchanged")
+    return counts
+
+
+def to_catalog_record(video, keywords, images, derivatives=None):
+    return {
+        'slug': video['slug_fs'],
+        'title': video['title'],
+        'category': video['category'] if not isnull(video['category']) else None,
+        'metadata': {key: str(value) for key, value in video_build_metadata(video, keywords, images, derivatives).items()},
+        'description': video['description'],
+    }
+
+
+def load_catalog():
+    # Catalog lines by slug
+    lines = {}
+    if os.path.isfile(CATALOG_PATH):
+        with open(CATALOG_PATH, encoding='utf-8') as f:
+            for line in f:
+                lines[json.loads(line)['slug']] = line.rstrip('\n')
+    return lines
+
+
+def write_catalog(videos, keywords, images, derivatives=None, clean=False):
+    # All videos in a single JSON lines file, read by the runningimages Pelican plugin
+    previous = {} if clean else load_catalog()
+    lines = {}
+    for video in videos:
+        record = to_catalog_record(video, keywords, images.get(video['slug_fs'], None), (derivatives or {}).get(video['slug_fs'], None))
+        lines[video['slug_fs']] = json.dumps(record, ensure_ascii=False)
+
+    counts = {'added': 0, 'changed': 0, 'removed': 0, 'unchanged': 0}
+    for slug, line in lines.items():
+        if slug not in previous:
+            counts['added'] += 1
+        elif previous[slug] != line:
+            counts['changed'] += 1
+        else:
+            counts['unchanged'] += 1
+    counts['removed'] = len(set(previous) - set(lines))
+
+    # Rewrite (atomically) only when something changed
+    if counts['added'] or counts['changed'] or counts['removed'] or not os.path.isfile(CATALOG_PATH):
+        tmp_path = f'{CATALOG_PATH}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for slug in sorted(lines):
+                f.write(lines[slug] + '\n')
+        os.replace(tmp_path, CATALOG_PATH)
+    print(f"Catalog videos: {counts['added']} added, {counts['changed']} changed, {counts['removed']} removed, {counts['unchanged']} unchanged")
+    return counts
+
+
+def build_site_content(videos, keywords, images, derivatives=None, clean=False):
+    add_missing_media_metas(videos)
+    if CONTENT_FORMAT == 'catalog':
+        counts = write_catalog(videos, keywords, images, derivatives, clean)
+        # Pages from a previous rst build would duplicate the catalog articles
+        write_video_pages([], keywords, images)
+    else:
+        counts = write_video_pages(videos, keywords, images, derivatives, clean)
+        if os.path.isfile(CATALOG_PATH):
+            os.remove(CATALOG_PATH)
+    for key, count in counts.items():
+        stats.incr(f'pages.{key}', count)
 
     kwd_items = {}
     for kwdtype, kwds in keywords.items():
         kwd_items[kwdtype] = [name for name, info in kwds.items() if info['is_tag']]
 
-    with open(os.path.join(BASEDIR, 'sitemeta.json'), 'w') as f:
-        json.dump({ 'tags': kwd_items }, f, indent=2)
-
-    return
-
+    # Keep sitemeta.json untouched when the tags did not change
+    sitemeta = json.dumps({ 'tags': kwd_items, 'separator': TAG_SEPARATOR }, indent=2)
+    sitemeta_path = os.path.join(BASEDIR, 'sitemeta.json')
+    previous = None
+    if os.path.isfile(sitemeta_path):
+        with open(sitemeta_path) as f:
+            previous = f.read()
+    if previous != sitemeta:
+        with open(sitemeta_path, 'w') as f:
+            f.write(sitemeta)
+
+    return counts
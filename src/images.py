@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+try:
+    # Registers the AVIF codec on Pillow versions without built-in support
+    import pillow_avif
+except ImportError:
+    pass
+
+from . import *
+from . import stats
+
+PIL_FORMATS = {'avif': 'AVIF', 'webp': 'WEBP', 'jpeg': 'JPEG'}
+# Bumped when the output paths change
+DERIVED_LAYOUT = 2
+SAVE_OPTIONS = {
+    'avif': {},
+    'webp': {'method': 6},
+    'jpeg': {'optimize': True, 'progressive': True},
+}
+
+
+def supported_formats():
+    # Derivative formats this Pillow build can write
+    Image.init()
+    extensions = Image.registered_extensions()
+    return [fmt for fmt in IMG_DERIVED_FORMATS if extensions.get(f'.{fmt}') in Image.SAVE]
+
+
+def load_derived_manifest():
+    if not os.path.isfile(IMG_DERIVED_MANIFEST_PATH):
+        return {}
+    with open(IMG_DERIVED_MANIFEST_PATH) as f:
+        return json.load(f)
+
+
+def save_derived_manifest(manifest):
+    os.makedirs(os.path.dirname(IMG_DERIVED_MANIFEST_PATH), exist_ok=True)
+    with open(IMG_DERIVED_MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def derived_widths(kind, width):
+    # Target widths, never upscaling: targets above the source width are replaced by the source width
+    widths = [w for w in IMG_DERIVED_WIDTHS[kind] if w < width]
+    if len(widths) < len(IMG_DERIVED_WIDTHS[kind]):
+        widths.append(width)
+    return widths
+
+
+def render_derivatives(basepath, fname, kind, formats):
+    # The kind is part of the output paths: main & thumb may be the same stored file, rendered
+    # concurrently with their own widths
+    stem = fname.rsplit('.', 1)[0]
+    os.makedirs(os.path.join(basepath, IMG_DERIVED_DIR), exist_ok=True)
+    outputs = []
+    with Image.open(os.path.join(basepath, fname)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        for width in derived_widths(kind, img.width):
+            resized = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            # Drop EXIF, ICC profile & co
+            resized.info = {}
+            for fmt in formats:
+                out = resized.convert('RGB') if fmt == 'jpeg' and resized.mode == 'RGBA' else resized
+                path = f'{IMG_DERIVED_DIR}/{stem}.{kind}.{width}w.{fmt}'
+                tmp_path = os.path.join(basepath, f'{path}.tmp')
+                out.save(tmp_path, PIL_FORMATS[fmt], quality=IMG_DERIVED_QUALITY[fmt], **SAVE_OPTIONS[fmt])
+                os.replace(tmp_path, os.path.join(basepath, path))
+                outputs.append({'path': path, 'width': width, 'format': fmt})
+    return outputs
+
+
+def build_derivatives(images, workers=IMG_DERIVED_WORKERS):
+    # Resized & recompressed versions of each downloaded image, only regenerated when the source
+    # or the settings changed. Returns {slug_fs: {kind: [{'path', 'width', 'format'}, ...]}}
+    basepath = os.path.join(BASEDIR, 'content', 'images')
+    formats = supported_formats()
+    manifest = load_derived_manifest()
+    new_manifest = {}
+    todo = []
+    for kind, fname in sorted({(kind, fname) for v_images in images.values() for kind, fname in v_images.items()}):
+        key = f'{kind}:{fname}'
+        path = os.path.join(basepath, fname)
+        st = os.stat(path)
+        settings = {'widths': IMG_DERIVED_WIDTHS[kind], 'formats': formats, 'quality': IMG_DERIVED_QUALITY, 'layout': DERIVED_LAYOUT}
+        entry = manifest.get(key, None)
+        if entry is not None and entry['settings'] == settings \
+                and all(os.path.isfile(os.path.join(basepath, out['path'])) for out in entry['outputs']):
+            # Only hash the source when its size or mtime moved
+            if entry['stat'] == [st.st_size, st.st_mtime_ns] or entry['hash'] == file_hash(path):
+                entry['stat'] = [st.st_size, st.st_mtime_ns]
+                new_manifest[key] = entry
+                continue
+        todo.append((key, kind, fname, settings, [st.st_size, st.st_mtime_ns]))
+
+    def render(job):
+        key, kind, fname, settings, stat = job
+        try:
+            return render_derivatives(basepath, fname, kind, formats)
+        except OSError as err:
+            # Truncated or corrupt download (UnidentifiedImageError is an OSError)
+            print(f'Warning: no derivatives for {kind} image {fname} - {err}')
+            return None
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for (key, kind, fname, settings, stat), outputs in zip(todo, pool.map(render, todo)):
+            if outputs is None:
+                failed += 1
+                continue
+            new_manifest[key] = {'hash': file_hash(os.path.join(basepath, fname)), 'stat': stat, 'settings': settings, 'outputs': outputs}
+
+    # Remove the derivatives that are not produced anymore
+    kept = {out['path'] for entry in new_manifest.values() for out in entry['outputs']}
+    for entry in manifest.values():
+        for out in entry['outputs']:
+            if out['path'] not in kept and os.path.isfile(os.path.join(basepath, out['path'])):
+                os.remove(os.path.join(basepath, out['path']))
+
+    save_derived_manifest(new_manifest)
+    regenerated = len(todo) - failed
+    print(f'Image derivatives: {regenerated} sources regenerated, {len(new_manifest) - regenerated} unchanged, {failed} failed ({", ".join(formats)})')
+    stats.incr('derivatives.regenerated', regenerated)
+    stats.incr('derivatives.unchanged', len(new_manifest) - regenerated)
+    stats.incr('derivatives.failed', failed)
+
+    # The pages of the failed sources use the original image only
+    return {
+        vslug: {kind: new_manifest[f'{kind}:{fname}']['outputs'] for kind, fname in v_images.items() if f'{kind}:{fname}' in new_manifest}
+        for vslug, v_images in images.items()
+    }
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from . import *
+
+
+class ImageStore:
+    # Images of content/images stored once per content hash. The index (imagemeta.json) maps
+    # the logical names (<slug_fs>.main, <slug_fs>.thumb) to the physical files.
+    # Files named after the slug from before the store (<slug_fs>.main.jpg) are adopted as they are.
+
+    def __init__(self, basepath=None, index_path=None):
+        self.basepath = basepath or os.path.join(BASEDIR, 'content', 'images')
+        self.index_path = index_path or IMAGE_INDEX_PATH
+        self._lock = threading.Lock()
+
+        # Single directory scan, all existence checks are done against it
+        self.files = {entry.name for entry in os.scandir(self.basepath) if entry.is_file()}
+
+        names = {}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path) as f:
+                names = json.load(f)['names']
+        self.names = {name: entry for name, entry in names.items() if entry['file'] in self.files}
+        self.by_hash = {entry['hash']: entry['file'] for entry in self.names.values()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+    def lookup(self, name):
+        # Physical file for a logical name, None if there is none
+        with self._lock:
+            entry = self.names.get(name, None)
+            if entry is not None:
+                return entry['file']
+            for ext in IMG_FORMATS:
+                if f'{name}.{ext}' in self.files:
+                    return self._adopt(name, f'{name}.{ext}')
+        return None
+
+    def _adopt(self, name, fname):
+        with open(os.path.join(self.basepath, fname), 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        # Same bytes already stored under another file: point to it, the duplicate goes at the next gc
+        fname = self.by_hash.setdefault(digest, fname)
+        self.names[name] = {'file': fname, 'hash': digest}
+        return fname
+
+    def entry(self, name):
+        with self._lock:
+            return self.names.get(name, None)
+
+    def add(self, name, chunks, ext, **validators):
+        # Stream the chunks to a temp file, moved in place once complete: an interrupted
+        # download never leaves a truncated image behind. validators: url, etag, last_modified
+        h = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.basepath, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    h.update(chunk)
+                    f.write(chunk)
+            digest = h.hexdigest()
+            with self._lock:
+                fname = self.by_hash.get(digest, None)
+                if fname is None:
+                    fname = f'{digest[:32]}.{ext}'
+                    os.replace(tmp_path, os.path.join(self.basepath, fname))
+                    self.files.add(fname)
+                    self.by_hash[digest] = fname
+                self.names[name] = {'file': fname, 'hash': digest, **{k: v for k, v in validators.items() if v}}
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return fname
+
+    def gc(self, slugs):
+        # Forget the names of the slugs not in the catalog anymore, remove the files no name points to
+        with self._lock:
+            slugs = set(slugs)
+            self.names = {name: entry for name, entry in self.names.items() if name.rsplit('.', 1)[0] in slugs}
+            used = {entry['file'] for entry in self.names.values()}
+            removed = []
+            for fname in sorted(self.files - used):
+                stem, ext = os.path.splitext(fname)
+                # Leftovers of interrupted runs
+                if ext == '.tmp' and fname.startswith('.'):
+                    os.remove(os.path.join(self.basepath, fname))
+                    removed.append(fname)
+                    continue
+                # Legacy files of a catalog slug that were never looked up are kept
+                if ext[1:] not in IMG_FORMATS or (stem.rsplit('.', 1)[0] in slugs and stem not in self.names):
+                    continue
+                os.remove(os.path.join(self.basepath, fname))
+                removed.append(fname)
+            self.files -= set(removed)
+            self.by_hash = {entry['hash']: entry['file'] for entry in self.names.values()}
+        return removed
+
+    def save(self):
+        with self._lock:
+            with open(self.index_path, 'w') as f:
+                json.dump({'names': dict(sorted(self.names.items()))}, f, indent=2)
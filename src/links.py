@@ -0,0 +1,128 @@
+import datetime
+import json
+import os
+import urllib.parse as urlparse
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from . import *
+from . import stats
+from .media import http_session, host_slot
+from .streams import parse_stream_url
+
+LINK_KEYS = ['link_stream', 'link_trailer', 'link_official']
+
+# oEmbed endpoints: they answer 404 for removed videos and 401/403 for the ones that can't be embedded
+OEMBED_URLS = {
+    'youtube': 'https://www.youtube.com/oembed?format=json&url={url}',
+    'vimeo': 'https://vimeo.com/api/oembed.json?url={url}',
+    'dailymotion': 'https://www.dailymotion.com/services/oembed?url={url}',
+}
+DEAD_CODES = {401, 403, 404, 410}
+# Web pages often answer 401/403 to scripts
+WEB_DEAD_CODES = {404, 410}
+
+
+def collect_links(videos):
+    # {url: {'type', 'vid', 'videos': [video id, ...]}}, each url once
+    links = {}
+    for video in videos:
+        for key in LINK_KEYS:
+            url = video[key]
+            if isnull(url):
+                continue
+            if url not in links:
+                linfo = parse_stream_url(video['id'], url) if key != 'link_official' else None
+                links[url] = {'type': linfo['type'] if linfo else 'web', 'vid': linfo['vid'] if linfo else None, 'videos': []}
+            links[url]['videos'].append(video['id'])
+    return links
+
+
+def probe_link(url, link_type):
+    # {'status': 'ok'|'dead'|'error', 'code', 'checked'}: dead links are gone for sure,
+    # errors (timeouts, 5xx, 429) are transient and checked again at the next run
+    probe_url = OEMBED_URLS[link_type].format(url=urlparse.quote(url, safe='')) if link_type in OEMBED_URLS else url
+    result = {'code': None, 'checked': datetime.datetime.now().isoformat(timespec='seconds')}
+    try:
+        with host_slot(probe_url):
+            if link_type in OEMBED_URLS:
+                r = http_session().get(probe_url, timeout=DOWNLOAD_TIMEOUT)
+            else:
+                r = http_session().head(probe_url, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True)
+                # Some servers do not implement HEAD, only the headers of the GET are read
+                if r.status_code in (403, 405, 501):
+                    r = http_session().get(probe_url, timeout=DOWNLOAD_TIMEOUT, allow_redirects=True, stream=True)
+                    r.close()
+        result['code'] = r.status_code
+        if r.status_code < 400:
+            result['status'] = 'ok'
+        elif r.status_code in (DEAD_CODES if link_type in OEMBED_URLS else WEB_DEAD_CODES):
+            result['status'] = 'dead'
+        else:
+            result['status'] = 'error'
+    except requests.ConnectionError as err:
+        # Unknown host or refused connection
+        result['status'] = 'dead' if any(msg in str(err) for msg in ['NameResolutionError', 'Name or service not known', 'nodename nor servname']) else 'error'
+        result['error'] = str(err)
+    except requests.RequestException as err:
+        result['status'] = 'error'
+        result['error'] = str(err)
+    return result
+
+
+def check_links(videos, cache, workers=DOWNLOAD_WORKERS, offline=False):
+    # Probe every link concurrently, links checked less than LINK_CHECK_TTL ago are taken from the cache
+    links = collect_links(videos)
+    results = {}
+    todo = []
+    for url, info in links.items():
+        cached = cache.get('link', url)
+        if cached is not None:
+            results[url] = cached
+        else:
+            todo.append(url)
+
+    if todo and offline:
+        print(f'Offline: skipped the check of {len(todo)} links')
+        todo = []
+    elif todo:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for url, result in zip(todo, pool.map(lambda url: probe_link(url, links[url]['type']), todo)):
+                results[url] = result
+                # Transient errors are not cached
+                if result['status'] != 'error':
+                    cache.set('link', url, result, ttl=LINK_CHECK_TTL)
+
+    report = {url: {**links[url], **results[url]} for url in sorted(results)}
+    counts = {status: sum(1 for item in report.values() if item['status'] == status) for status in ['ok', 'dead', 'error']}
+    for status, count in counts.items():
+        stats.incr(f'links.{status}', count)
+    stats.incr('links.probed', len(todo))
+    write_link_report(report)
+    print(f"Links: {counts['ok']} ok, {counts['dead']} dead, {counts['error']} errors ({len(todo)} probed, {len(results) - len(todo)} cached)")
+    for url, item in report.items():
+        if item['status'] == 'dead':
+            print(f"Dead link: {url} [{item['code']}] in videos {', '.join(str(vid) for vid in item['videos'])}")
+    return report
+
+
+def write_link_report(report, path=LINK_REPORT_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def load_link_report(path=LINK_REPORT_PATH):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def apply_link_status(videos, report=None):
+    # Mark the dead links of each video, media_metas ignores them (a dead stream falls back to the trailer)
+    report = load_link_report() if report is None else report
+    dead = {url for url, item in report.items() if item['status'] == 'dead'}
+    for video in videos:
+        video['dead_links'] = [video[key] for key in LINK_KEYS if not isnull(video[key]) and video[key] in dead]
+    return videos
@@ -1,88 +1,218 @@
-import numpy as np
 import os
 import pyyoutube
 import requests
 import json
 import vimeo
 import urllib.parse as urlparse
-import re
+import threading
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from . import *
+from . import stats
+from .imagestore import ImageStore
+from .streams import parse_stream_url
 
-IMG_FORMATS = ['jpg', 'jpeg', 'gif', 'png']
 MIN_THUMB_WIDTH = 120
+YOUTUBE_BATCH_SIZE = 50
+VIMEO_BATCH_SIZE = 50
 
+_session = None
+_host_slots = {}
+_lock = threading.Lock()
 
-def youtube_get_video(urldata):
+
+def http_session():
+    # One pooled session shared by all download threads
+    global _session
+    with _lock:
+        if _session is None:
+            pool_size = max([DOWNLOAD_HOST_LIMIT] + list(DOWNLOAD_HOST_LIMITS.values()))
+            adapter = requests.adapters.HTTPAdapter(pool_connections=DOWNLOAD_WORKERS, pool_maxsize=pool_size)
+            _session = requests.Session()
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+    return _session
+
+
+def host_slot(url):
+    # Semaphore limiting the number of simultaneous requests to a given host
+    host = urlparse.urlparse(url).netloc
+    with _lock:
+        if host not in _host_slots:
+            _host_slots[host] = threading.BoundedSemaphore(DOWNLOAD_HOST_LIMITS.get(host, DOWNLOAD_HOST_LIMIT))
+        return _host_slots[host]
+
+
+@functools.lru_cache(maxsize=None)
+def youtube_api():
     with open(os.path.join(BASEDIR, 'secrets', 'youtube_api_key')) as f:
-        yt_key = f.read()
-    api = pyyoutube.Api(api_key=yt_key)
-    return api.get_video_by_id(video_id=urldata['vid'])
+        yt_key = f.read().strip()
+    return pyyoutube.Api(api_key=yt_key)
 
 
-def vimeo_get_video(urldata):
+@functools.lru_cache(maxsize=None)
+def vimeo_api():
     with open(os.path.join(BASEDIR, 'secrets', 'vimeo.json')) as f:
         vm_creds = json.load(f)
-    v = vimeo.VimeoClient(**vm_creds)
-    return v.get(f'https://api.vimeo.com/videos/{urldata["vid"]}').json()
-
-
-def parse_stream_url(video_id, ss):
-    out = None
-    try:
-        url = urlparse.urlparse(ss)
-        out = {}
-        if 'youtube' in url.netloc:
-            out['type'] = 'youtube'
-            out['vid'] = urlparse.parse_qs(url.query)['v'][0]
-            out['url'] = url
-        elif 'vimeo' in url.netloc:
-            out['type'] = 'vimeo'
-            out['vid'] = re.match(r'.*vimeo\.com\/([0-9]+)$', f'{url.netloc}{url.path}').groups()[0]
-            out['url'] = url
-        elif 'dailymotion' in url.netloc:
-            out['type'] = 'dailymotion'
-            out['vid'] = url.path.split('/')[-1]
-            out['url'] = url
-        else:
-            out = None
-    except Exception as err:
-        out = None
-        #raise RuntimeError(f"Invalid URL {ss} for video id={video_id}")
+    return vimeo.VimeoClient(**vm_creds)
+
+
+def youtube_get_videos(vids):
+    # Returns the snippet of each video found, by video id
+    out = {}
+    for i in range(0, len(vids), YOUTUBE_BATCH_SIZE):
+        vdata = youtube_api().get_video_by_id(video_id=vids[i:i + YOUTUBE_BATCH_SIZE], parts='id,snippet')
+        stats.incr('api_calls.youtube')
+        for item in vdata.items:
+            out[item.id] = item.to_dict()['snippet']
+    return out
+
+
+def vimeo_get_video(vid):
+    r = vimeo_api().get(f'https://api.vimeo.com/videos/{vid}', params={'fields': 'uri,pictures'})
+    stats.incr('api_calls.vimeo')
+    if r.status_code != 200:
+        return None
+    return r.json()
 
+
+def vimeo_get_videos(vids):
+    # Returns the pictures of each video found, by video id
+    out = {}
+    for i in range(0, len(vids), VIMEO_BATCH_SIZE):
+        batch = vids[i:i + VIMEO_BATCH_SIZE]
+        r = vimeo_api().get('https://api.vimeo.com/videos', params={
+            'links': ','.join(f'https://vimeo.com/{vid}' for vid in batch),
+            'fields': 'uri,pictures',
+            'per_page': len(batch),
+        })
+        stats.incr('api_calls.vimeo')
+        items = r.json().get('data', []) if r.status_code == 200 else []
+        for item in items:
+            out[item['uri'].split('/')[-1]] = item['pictures']
+        # Lookup by links may skip some videos (private, unlisted), get these one by one
+        for vid in batch:
+            if vid in out:
+                continue
+            item = vimeo_get_video(vid)
+            if item is not None:
+                out[vid] = item['pictures']
     return out
 
 
-def download_image(url, basepath, filename):
+def counted_chunks(r):
+    for chunk in r.iter_content(DOWNLOAD_CHUNK_SIZE):
+        stats.incr('images.bytes', len(chunk))
+        yield chunk
+
+
+def download_image(url, store, name):
     # Extract extension:
     ext = urlparse.urlparse(url).path.split('/')[-1].split('.')[-1]
     if ext not in IMG_FORMATS :
         raise RuntimeError(f'Unexpected img extension for url "{url}"')
-    fname = f'{filename}.{ext}'
-    r = requests.get(url, timeout=2)
-    if r.status_code == 200:
-        with open(os.path.join(basepath, fname), 'wb') as f:
-            f.write(r.content)
-    else:
-        raise RuntimeError(f'Unexpected response "{r.status_code}" from "{url}"')
-    return fname
 
+    # Revalidate what we already have for this url
+    headers = {}
+    entry = store.entry(name)
+    if entry is not None and entry.get('url') == url:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
 
-def images_get_from_links(video, img_basepath):
-    # Get the image from main stream if supported, if not, get from trailer, if not, well fuck
-    MIN_THUMB_WIDTH = 120
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            with host_slot(url), http_session().get(url, headers=headers, timeout=DOWNLOAD_TIMEOUT, stream=True) as r:
+                if r.status_code == 304:
+                    stats.incr('images.not_modified')
+                    return entry['file']
+                if r.status_code == 429 or r.status_code >= 500:
+                    raise requests.HTTPError(f'Unexpected response "{r.status_code}"', response=r)
+                if r.status_code != 200:
+                    raise RuntimeError(f'Unexpected response "{r.status_code}" from "{url}"')
+                fname = store.add(name, counted_chunks(r), ext, url=url,
+                                  etag=r.headers.get('ETag'), last_modified=r.headers.get('Last-Modified'))
+                stats.incr('images.downloaded')
+                return fname
+        except requests.RequestException as err:
+            if attempt == DOWNLOAD_RETRIES:
+                raise RuntimeError(f'Failed to download "{url}" after {attempt + 1} attempts - {err}')
+            stats.incr('images.retries')
+            time.sleep(DOWNLOAD_BACKOFF * 2 ** attempt)
+
+
+def refresh_images(video, store, urls=None):
+    # Conditional GET of the images downloaded for a video, unchanged images cost a 304. urls: the
+    # ones resolved again for the images without a stored url (adopted from the legacy layout).
+    v_images = {}
+    for kind in ['thumb', 'main']:
+        entry = store.entry(f'{video["slug_fs"]}.{kind}')
+        url = entry.get('url') if entry is not None else None
+        url = url or (urls or {}).get(kind, None)
+        if url:
+            v_images[kind] = download_image(url, store, f'{video["slug_fs"]}.{kind}')
+    return v_images
+
+
+def stored_urls_missing(video, store):
+    # The images of the video whose url is not known
+    entries = [store.entry(f'{video["slug_fs"]}.{kind}') for kind in ['thumb', 'main']]
+    return any(entry is not None and not entry.get('url') for entry in entries)
+
+
+def collect_video_ids(videos):
+    # Unique video ids per provider, from stream and trailer links
+    ids = {'youtube': {}, 'vimeo': {}}
+    for video in videos:
+        for key in ['link_stream', 'link_trailer']:
+            if isnull(video[key]):
+                continue
+            urldata = parse_stream_url(video['id'], video[key])
+            if urldata is None or urldata['type'] not in ids:
+                continue
+            ids[urldata['type']][urldata['vid']] = True
+    return {provider: list(vids) for provider, vids in ids.items()}
+
+
+def fetch_video_metadata(videos, cache=None):
+    # Resolve all the videos in batches, one API client per provider. Cached payloads are not fetched again.
+    ids = collect_video_ids(videos)
+    fetchers = {'youtube': youtube_get_videos, 'vimeo': vimeo_get_videos}
+    metadata = {}
+    for provider, vids in ids.items():
+        to_fetch = []
+        for vid in vids:
+            payload = cache.get(provider, vid) if cache is not None else None
+            if payload is None:
+                to_fetch.append(vid)
+            else:
+                metadata[(provider, vid)] = payload
+        if not to_fetch:
+            continue
+        for vid, payload in fetchers[provider](to_fetch).items():
+            metadata[(provider, vid)] = payload
+            if cache is not None:
+                cache.set(provider, vid, payload)
+        print(f'Fetched {provider} metadata for {len(to_fetch)} videos ({len(vids) - len(to_fetch)} cached)')
+    return metadata
+
+
+def resolve_image_urls(video, metadata):
+    # {'thumb': url, 'main': url} from the main stream if supported, if not from the trailer, None if neither
     v_images = None
     for key in ['link_stream', 'link_trailer']:
-        if video[key] is np.NaN:
+        if isnull(video[key]):
             continue
         urldata = parse_stream_url(video['id'], video[key])
         if urldata is None:
             continue
         if urldata['type'] == 'youtube':
-            vdata = youtube_get_video(urldata)
-            if len(vdata.items) == 0:
+            yt_vid = metadata.get(('youtube', urldata['vid']), None)
+            if yt_vid is None:
                 continue
-            yt_vid = vdata.items[0].to_dict()['snippet']
             if 'thumbnails' in yt_vid and yt_vid['thumbnails']:
                 imgs = []
                 for imgsize in ['default', 'medium', 'high', 'standard', 'maxres']:
@@ -95,10 +225,11 @@ def images_get_from_links(video, img_basepath):
                 break
 
         elif urldata['type'] == 'vimeo':
-            cdata = vimeo_get_video(urldata)
-            pictures = cdata['pictures']['sizes']
+            vm_pictures = metadata.get(('vimeo', urldata['vid']), None)
+            if vm_pictures is None:
+                continue
             imgs = []
-            for pic in pictures:
+            for pic in vm_pictures['sizes']:
                 if pic['width'] >= MIN_THUMB_WIDTH:
                     imgs.append(pic)
             imgs.sort(key=lambda x: x['width'])
@@ -111,10 +242,17 @@ def images_get_from_links(video, img_basepath):
             }
             break
 
+    return v_images
+
+
+def images_get_from_links(video, store, metadata):
+    # Get the image from main stream if supported, if not, get from trailer, if not, well fuck
+    v_images = resolve_image_urls(video, metadata)
+
     if v_images is not None:
     # Download the img files
-        v_images['thumb'] = download_image(v_images['thumb'], img_basepath, f'{video["slug_fs"]}.thumb')
-        v_images['main'] = download_image(v_images['main'], img_basepath, f'{video["slug_fs"]}.main')
+        v_images['thumb'] = download_image(v_images['thumb'], store, f'{video["slug_fs"]}.thumb')
+        v_images['main'] = download_image(v_images['main'], store, f'{video["slug_fs"]}.main')
         print(f'Downloaded images for video {video["slug_fs"]}[{video["id"]}]')
     else:
         print(f'Unable to download images for video {video["slug_fs"]}[{video["id"]}] using urls: {video["link_trailer"]}, {video["link_stream"]}')
@@ -122,21 +260,19 @@ def images_get_from_links(video, img_basepath):
     return v_images
 
 
-def download_images(videos):
+def download_images(videos, workers=DOWNLOAD_WORKERS, cache=None, offline=False, refresh=False):
     images = {}
-    images_basepath = os.path.join(BASEDIR, 'content', 'images')
+    missing = []
+    store = ImageStore()
     for video in videos:
-        # Support multiple file formats
-        path = None
         vslug = video['slug_fs']
         v_images = {}
 
         # Check if imgs already exist for this video
-        for img_format in IMG_FORMATS:
-            if os.path.isfile(os.path.join(images_basepath, f'{vslug}.main.{img_format}')):
-                v_images['main'] = f'{vslug}.main.{img_format}'
-            if os.path.isfile(os.path.join(images_basepath, f'{vslug}.thumb.{img_format}')):
-                v_images['thumb'] = f'{vslug}.thumb.{img_format}'
+        for kind in ['main', 'thumb']:
+            fname = store.lookup(f'{vslug}.{kind}')
+            if fname is not None:
+                v_images[kind] = fname
 
         # if there is only a thumb, set it as main also, is only main, set it as thumb also.
         if 'main' in v_images and 'thumb' not in v_images:
@@ -144,11 +280,44 @@ def download_images(videos):
         elif 'thumb' in v_images and 'main' not in v_images:
             v_images['main'] = v_images['thumb']
         elif not v_images:
-            v_images = images_get_from_links(video, images_basepath)
+            missing.append(video)
+            continue
 
-        if v_images is not None:
-            images[vslug] = v_images
+        images[vslug] = v_images
 
-    return images
+    # Revalidate the images, the urls not stored are resolved again from the provider metadata
+    if refresh and not offline:
+        present = [video for video in videos if video['slug_fs'] in images]
+        unknown = [video for video in present if stored_urls_missing(video, store)]
+        metadata = fetch_video_metadata(unknown, cache) if unknown else {}
+        urls = {video['slug_fs']: resolve_image_urls(video, metadata) for video in unknown}
+        skipped = sum(1 for vurls in urls.values() if vurls is None)
+        if skipped:
+            print(f'Refresh: no image url for {skipped} videos, their images are kept as they are')
+        stats.incr('images.refresh_skipped', skipped)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(video['slug_fs'], pool.submit(refresh_images, video, store, urls.get(video['slug_fs'], None))) for video in present]
+            for vslug, future in futures:
+                images[vslug].update(future.result())
 
+    stats.incr('images.present', len(images))
+    stats.incr('images.missing', len(missing))
+    # Fetch the missing images concurrently, results are collected per video
+    if missing and offline:
+        print(f'Offline: skipped image download for {len(missing)} videos')
+    elif missing:
+        metadata = fetch_video_metadata(missing, cache)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(video['slug_fs'], pool.submit(images_get_from_links, video, store, metadata)) for video in missing]
+            for vslug, future in futures:
+                v_images = future.result()
+                if v_images is not None:
+                    images[vslug] = v_images
 
+    # Drop the images of videos that left the catalog
+    removed = store.gc(video['slug_fs'] for video in videos)
+    if removed:
+        print(f'Removed {len(removed)} unused images')
+    store.save()
+    stats.incr('images.files', len(store.files))
+    return images
@@ -1,178 +1,156 @@
-import pyyoutube
 import gspread
 import pandas as pd
-from leven import levenshtein
 import pycountry
-import re
 import os
 import numpy as np
-import datetime as dt
+import json
 
 from . import *
+from . import stats
+from .similarity import find_similar
+from .schema import DATE_FORMAT, DURATION_FORMAT, check_sheet, remove_tags
 
-TAG_RE = re.compile(r'<[^>]+>')
 
+def sheet_modified_time(sh):
+    # Drive modifiedTime of the spreadsheet, None if this gspread version can't tell
+    try:
+        if hasattr(sh, 'get_lastUpdateTime'):
+            return sh.get_lastUpdateTime()
+        return sh.lastUpdateTime
+    except Exception as err:
+        print(f'Unable to get the spreadsheet modified time - {err}')
+        return None
 
-def download_gspread():
-    gc = gspread.service_account(filename=os.path.join(BASEDIR, 'secrets', 'runningimages.key.json'))
-    sh = gc.open("Running Images")
-    return pd.DataFrame(sh.sheet1.get_all_records())
+
+def load_sheet_snapshot():
+    if not os.path.isfile(SHEET_SNAPSHOT_PATH) or not os.path.isfile(SHEET_SNAPSHOT_META_PATH):
+        return None, None
+    with open(SHEET_SNAPSHOT_META_PATH) as f:
+        meta = json.load(f)
+    return pd.read_parquet(SHEET_SNAPSHOT_PATH), meta
+
+
+def save_sheet_snapshot(values, meta):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    values.to_parquet(SHEET_SNAPSHOT_PATH, index=False)
+    with open(SHEET_SNAPSHOT_META_PATH, 'w') as f:
+        json.dump(meta, f, indent=2)
 
 
-def validate_non_empty(df, colname):
-    errs = df[df[colname].isna()]
-    if not errs.empty:
-        print(f'Found empty/wrong values in column {colname}')
-        print(errs)
-        raise RuntimeError(f'Empty values in critical column {colname}')
+def sheet_records(values):
+    # Same typing as gspread's get_all_records() on the raw cell values
+    rows = [gspread.utils.numericise_all(row, empty2zero=False, default_blank='') for row in values.itertuples(index=False, name=None)]
+    return pd.DataFrame(rows, columns=values.columns)
 
 
-def validate_unique(df, colname):
-    errs = df[df[colname].duplicated(keep=False)]
-    if not errs.empty:
-        print(f'Found duplicate values in unique column {col}')
-        print(errs)
-        raise RuntimeError(f'Duplicate values in unique column {col}')
+def download_gspread(offline=False):
+    values, meta = load_sheet_snapshot()
+    if offline:
+        if values is None:
+            raise RuntimeError(f'No spreadsheet snapshot in {SHEET_SNAPSHOT_PATH}, run once online first')
+        print(f'Offline: using spreadsheet snapshot from {meta["modified"]}')
+        stats.incr('sheet.snapshot_hits')
+        return sheet_records(values)
 
+    gc = gspread.service_account(filename=os.path.join(BASEDIR, 'secrets', 'runningimages.key.json'))
+    sh = gc.open(SHEET_NAME)
+    modified = sheet_modified_time(sh)
+    if values is not None and modified is not None and meta.get('modified') == modified:
+        print(f'Spreadsheet unchanged since {modified}, using snapshot')
+        stats.incr('sheet.snapshot_hits')
+        return sheet_records(values)
 
-def validate_is_yesno(df, colname):
-    errs = df[~df[colname].isin(['yes', 'no'])]
-    if not errs.empty:
-        print(f'Found bad values in bool column {col}')
-        print(errs)
-        raise RuntimeError(f'Bad values in bool column {col}')
+    cells = sh.sheet1.get_all_values()
+    stats.incr('sheet.downloads')
+    values = pd.DataFrame(cells[1:], columns=cells[0], dtype=str)
+    save_sheet_snapshot(values, {'modified': modified, 'rows': len(values)})
+    return sheet_records(values)
 
 
-def remove_tags(text):
-    if not text:
-        return text
-    return TAG_RE.sub('', text).strip()
+def country_names():
+    return {country.alpha_2.upper(): country.name for country in pycountry.countries}
 
 
-def clean_gspread_data(orig_data):
+def clean_gspread_data(orig_data, report_path=None):
 
     data = orig_data.copy()
 
     # minimal data clean and type casting
-    data = data.applymap(lambda x: x.strip() if type(x) is str else x)
+    for colname in data.select_dtypes(include='object').columns:
+        col = data[colname]
+        if pd.api.types.infer_dtype(col, skipna=True) in ('string', 'mixed', 'mixed-integer'):
+            data[colname] = col.str.strip().fillna(col)
     data = data.replace('', np.nan)
 
+    # All the rules of the columns at once, rows not for export are not checked
+    check_sheet(data, skip=data.export.eq('no'), report_path=report_path)
+
     # Drop rows not for export
-    validate_is_yesno(data, 'export')
     data = data[data.export == 'yes']
 
     # Drop cols not for export
     data = data.drop(['saw', 'export'], axis=1)
 
-    # Col id
-    validate_non_empty(data, 'id')
-    validate_unique(data, 'id')
-
     # Col title
-    validate_non_empty(data, 'title')
-    data['title'] = data.title.apply(remove_tags)
-    validate_unique(data, 'title')
+    data['title'] = remove_tags(data.title)
 
     # Col release_year
-    validate_non_empty(data, 'release_year')
-    if data.release_year.dtype is not np.dtype('int64'):
-        raise RuntimeError(f'Invalid value(s) in release_year field. Column type is not int64')
+    data['release_year'] = data.release_year.astype('int64')
 
     # Col slug -> slug_fs + slug_web
-    validate_non_empty(data, 'slug')
-    data['slug_fs'] = data.slug.apply(lambda x: x.lower())
-    validate_unique(data, 'slug_fs')
-    def build_web_slug(idx, slug):
-        if re.match(r'^[0-9a-z\_]+$', slug) is None:
-            raise RuntimeError(f'Invalid slug in col id == {idx} ({slug})')
-        return slug.replace('_', '-')
-    data['slug_web'] = data.apply(lambda row: build_web_slug(row.id, row.slug_fs), axis=1)
+    data['slug_fs'] = data.slug.astype(str).str.lower()
+    data['slug_web'] = data.slug_fs.str.replace('_', '-', regex=False)
     data.drop('slug', axis=1, inplace=True)
 
     # Col created
-    validate_non_empty(data, 'created')
-    def parse_created(row):
-        try:
-            return dt.datetime.strptime(row.created, "%Y/%m/%d")
-        except Exception as err:
-            raise RuntimeError(f'Failed to parse created for row.id == {row.id} ({row.created}) - {err}')
-    data['created'] = data.apply(parse_created, axis=1)
+    data['created'] = pd.to_datetime(data.created.astype(str), format=DATE_FORMAT)
 
     # Col duration
-    def parse_duration(row):
-        if row.duration is np.NaN:
-            return row.duration
-        try:
-            t = dt.datetime.strptime(row.duration, "%H:%M:%S")
-            return dt.timedelta(hours=t.hour, minutes=t.minute, seconds=t.second)
-        except Exception as err:
-            raise RuntimeError(f'Failed to parse duration for row.id == {row.id} ({row.duration}) - {err}')
-    data['duration'] = data.apply(parse_duration, axis=1)
+    durations = data.duration.dropna()
+    times = pd.to_datetime(durations.astype(str), format=DURATION_FORMAT)
+    data['duration'] = (times - times.dt.normalize()).reindex(data.index)
 
     # Col language
-    def parse_lang(idx, lang):
-        if lang is np.NaN:
-            return lang
-        if lang not in LANG_MAP:
-            raise RuntimeError(f'Unknown language in col id == {idx} ({lang})')
-        return LANG_MAP[lang]
-    data['language'] = data.apply(lambda row: parse_lang(row.id, row.language), axis=1)
+    data['language'] = data.language.map(LANG_MAP)
 
     # Col country
-    def country_name(idx, code):
-        if code is np.NaN:
-            return code
-        cty = pycountry.countries.get(alpha_2=code)
-        if cty is not None:
-            return cty.name
-        raise RuntimeError(f'Unknown country code in col id == {idx} ({code})')
-    data['country'] = data.apply(lambda row: country_name(row.id, row.country), axis=1)
+    data['country'] = data.country.dropna().astype(str).str.upper().map(country_names()).reindex(data.index)
 
     # Cols direction, production, events, sponsors, people
-    # Split into items
-    get_name = lambda col, label: NAME_MAPS.get(col, {}).get(label, {}).get('name', label)
+    # Split into unique items (sorted on the raw value), then map labels to names
     for colname in ['events', 'people', 'sponsors', 'production', 'direction']:
-        data[colname] = data[colname].str.split(',').apply(lambda items: [get_name(colname, item.strip()) for item in np.unique(items)] if type(items) is list else items)
+        names = {label: info.get('name', label) for label, info in NAME_MAPS.get(colname, {}).items()}
+        items = data[colname].dropna().astype(str).str.split(',').explode()
+        items = pd.DataFrame({'row': items.index, 'item': items.values}).drop_duplicates().sort_values(['row', 'item'])
+        items['name'] = items['item'].str.strip()
+        items['name'] = items['name'].map(names).fillna(items['name'])
+        data[colname] = items.groupby('row', sort=False)['name'].agg(list).reindex(data.index)
 
     # Col description
-    validate_non_empty(data, 'description')
-    data['description'] = data.description.apply(remove_tags)
+    data['description'] = remove_tags(data.description)
 
     # TODO Warn if no video link in video
 
     # Col free access
-    validate_non_empty(data, 'free_access')
-    data['free_access'] = data['free_access'].apply(lambda val: val == 'yes')
+    data['free_access'] = data.free_access == 'yes'
 
     # Add category info
-    def set_category(year):
-        if year < 2000:
-            return 'x-1999'
-        elif year < 2005:
-            return '2000-2004'
-        elif year < 2010:
-            return '2005-2009'
-        elif year < 2015:
-            return '2010-2014'
-        else:
-            return '2015-x'
-    data['category'] = data.release_year.apply(set_category)
+    year = data.release_year
+    data['category'] = np.select(
+        [year < 2000, year < 2005, year < 2010, year < 2015],
+        ['x-1999', '2000-2004', '2005-2009', '2010-2014'],
+        default='2015-x')
 
     return data
 
 
-def extract_keywords(data, similarity_threshold=3):
+def extract_keywords(data, similarity_threshold=3, workers=1):
     def item_table(data, colname):
         items = pd.DataFrame(data[colname].dropna().explode().str.strip().value_counts())
         items.columns = ['counts']
         items['is_tag'] = items.counts.apply(lambda c: c >= TAG_MIN_COUNT)
         return items
 
-    def find_similar(items, similarity_threshold=3):
-        itemnb = len(items)
-        scores = [(items[i],items[j],levenshtein(items[i],items[j])) for i in range(itemnb) for j in range(i+1, itemnb)]
-        return sorted([x for x in scores if x[2] <= similarity_threshold], key=lambda x: x[2])
-
     out = {
         'events': item_table(data, 'events'),
         'people': item_table(data, 'people'),
@@ -182,7 +160,7 @@ def extract_keywords(data, similarity_threshold=3):
     }
 
     for k, items in out.items():
-        similar = find_similar(items.index.to_list(), similarity_threshold)
+        similar = find_similar(items.index.to_list(), similarity_threshold, workers)
 
         if len(similar):
             print(f'\n\nFound similar "{k}" keywords. You may want to review these:')
@@ -199,9 +177,14 @@ def extract_keywords(data, similarity_threshold=3):
     return out_final
 
 
-def build_site_data():
-    data = download_gspread()
-    data_df = clean_gspread_data(data)
-    keywords = extract_keywords(data_df)
+def build_site_data(offline=False):
+    with stats.stage('fetch'):
+        data = download_gspread(offline)
+    with stats.stage('clean'):
+        data_df = clean_gspread_data(data, report_path=SCHEMA_REPORT_PATH)
+    stats.incr('rows.in', len(data))
+    stats.incr('rows.out', len(data_df))
+    with stats.stage('keywords'):
+        keywords = extract_keywords(data_df)
     videos = data_df.to_dict('records')
     return videos, keywords
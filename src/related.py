@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from . import *
+
+
+def keyword_matrix(videos, keywords):
+    # Sparse videos x keywords matrix, IDF weighted over the keyword counts, rows L2-normalized.
+    # Keywords of a single video can't relate two videos and are left out.
+    nb_videos = len(videos)
+    parts = []
+    for kwdtype, items in keywords.items():
+        values = pd.Series([video[kwdtype] for video in videos], dtype=object).explode().dropna()
+        kwds = pd.DataFrame({'row': values.index, 'name': values.astype(str).str.strip().values})
+        kwds['counts'] = kwds['name'].map({name: info['counts'] for name, info in items.items()})
+        kwds = kwds[kwds['counts'] >= 2]
+        kwds = kwds.assign(key=f'{kwdtype}:' + kwds['name'])
+        parts.append(kwds)
+    kwds = pd.concat(parts, ignore_index=True)
+
+    cols, uniques = pd.factorize(kwds['key'])
+    weights = np.log1p(nb_videos / kwds['counts'].to_numpy(dtype=float))
+    matrix = sparse.csr_matrix((weights, (kwds['row'].to_numpy(), cols)), shape=(nb_videos, len(uniques)))
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def find_related(videos, keywords, count=RELATED_COUNT, chunk_size=RELATED_CHUNK_SIZE):
+    # Top `count` videos sharing the most (and rarest) keywords with each video: {slug_fs: [slug_web, ...]}
+    matrix = keyword_matrix(videos, keywords).tocsr()
+    transposed = matrix.T.tocsr()
+    related = {}
+    for start in range(0, len(videos), chunk_size):
+        # Cosine similarities of a chunk of videos with all the others, sparse as only shared keywords count
+        scores = (matrix[start:start + chunk_size] @ transposed).tocsr()
+        for i in range(scores.shape[0]):
+            lo, hi = scores.indptr[i], scores.indptr[i + 1]
+            idx, val = scores.indices[lo:hi], scores.data[lo:hi]
+            keep = (idx != start + i) & (val > 0)
+            idx, val = idx[keep], val[keep]
+            # Best score first, catalog order on ties: (-score, position) over all the candidates, so the
+            # cutoff is deterministic too
+            order = np.lexsort((idx, -val))[:count]
+            related[videos[start + i]['slug_fs']] = [videos[j]['slug_web'] for j in idx[order]]
+    return related
+
+
+def add_related(videos, keywords):
+    related = find_related(videos, keywords)
+    for video in videos:
+        video['related'] = related.get(video['slug_fs'], [])
+    print(f'Found related videos for {sum(1 for slugs in related.values() if slugs)} of {len(videos)} videos')
+    return videos
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+import pycountry
+
+from . import *
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def remove_tags(col):
+    return col.astype(str).str.replace(TAG_RE, '', regex=True).str.strip()
+
+
+def lower(col):
+    return col.astype(str).str.lower()
+
+
+def upper(col):
+    return col.astype(str).str.upper()
+
+
+def country_codes():
+    return [country.alpha_2.upper() for country in pycountry.countries]
+
+
+# Rules of the sheet columns, checked on the exported rows:
+#   required: no empty value
+#   key: normalization applied before the unique, enum and regex checks
+#   unique: no two rows with the same (normalized) value
+#   enum: allowed values, or a function returning them
+#   regex: the (normalized) value must fully match
+#   format: 'int', 'date' (DATE_FORMAT) or 'duration' (DURATION_FORMAT)
+SHEET_SCHEMA = {
+    'export': {'required': True, 'enum': ['yes', 'no']},
+    'id': {'required': True, 'unique': True},
+    'title': {'required': True, 'key': remove_tags, 'unique': True},
+    'release_year': {'required': True, 'format': 'int'},
+    'slug': {'required': True, 'key': lower, 'unique': True, 'regex': r'[0-9a-z\_]+'},
+    'created': {'required': True, 'format': 'date'},
+    'duration': {'format': 'duration'},
+    'language': {'enum': lambda: list(LANG_MAP)},
+    'country': {'key': upper, 'enum': country_codes},
+    'description': {'required': True},
+    'free_access': {'required': True, 'enum': ['yes', 'no']},
+}
+
+DATE_FORMAT = '%Y/%m/%d'
+DURATION_FORMAT = '%H:%M:%S'
+
+
+class SchemaError(RuntimeError):
+    # All the violations of the sheet, see validate()
+
+    def __init__(self, violations):
+        self.violations = violations
+        super().__init__(f'{len(violations)} invalid value(s) in the sheet:\n{format_report(violations)}')
+
+
+def format_check(col, fmt):
+    # Mask of the values that do not match fmt
+    if fmt == 'int':
+        numbers = pd.to_numeric(col, errors='coerce')
+        return numbers.isna() | (numbers != numbers.round())
+    if fmt == 'date':
+        return pd.to_datetime(col.astype(str), format=DATE_FORMAT, errors='coerce').isna()
+    if fmt == 'duration':
+        return pd.to_datetime(col.astype(str), format=DURATION_FORMAT, errors='coerce').isna()
+    raise ValueError(f'Unknown schema format {fmt}')
+
+
+def column_checks(col, rules):
+    # [(rule, message, mask of the failing rows)] for the present values of col
+    present = col.notna()
+    values = col[present]
+    keys = rules['key'](values) if 'key' in rules else values
+    checks = []
+    if rules.get('required', False):
+        checks.append(('required', 'empty value', ~present))
+    if rules.get('unique', False):
+        checks.append(('unique', 'duplicate value', keys.duplicated(keep=False)))
+    if 'enum' in rules:
+        allowed = rules['enum']() if callable(rules['enum']) else rules['enum']
+        checks.append(('enum', f"not one of {', '.join(map(str, allowed[:10]))}{'...' if len(allowed) > 10 else ''}", ~keys.isin(allowed)))
+    if 'regex' in rules:
+        checks.append(('regex', f"does not match {rules['regex']}", ~keys.astype(str).str.fullmatch(rules['regex'])))
+    if 'format' in rules:
+        checks.append((rules['format'], f"not a valid {rules['format']}", format_check(values, rules['format'])))
+    return [(rule, message, mask.reindex(col.index, fill_value=False)) for rule, message, mask in checks]
+
+
+def validate(data, schema=SHEET_SCHEMA, skip=None):
+    # Every violation of the schema: [{'row', 'id', 'column', 'rule', 'value', 'message'}] sorted by
+    # row. row is the line in the sheet, the rows in skip (boolean mask) are not checked.
+    rows = data[~skip] if skip is not None else data
+    violations = []
+    for colname, rules in schema.items():
+        if colname not in rows:
+            violations.append({'row': None, 'id': None, 'column': colname, 'rule': 'column', 'value': None, 'message': 'missing column'})
+            continue
+        col = rows[colname]
+        for rule, message, mask in column_checks(col, rules):
+            bad = np.flatnonzero(mask.to_numpy())
+            for pos, idx in zip(bad, rows.index[bad]):
+                value = col.iloc[pos]
+                violations.append({
+                    # Header is line 1
+                    'row': int(data.index.get_loc(idx)) + 2,
+                    'id': rows['id'].iloc[pos] if 'id' in rows and not pd.isna(rows['id'].iloc[pos]) else None,
+                    'column': colname,
+                    'rule': rule,
+                    'value': None if pd.isna(value) else value,
+                    'message': message,
+                })
+    return sorted(violations, key=lambda v: (v['row'] or 0, list(schema).index(v['column'])))
+
+
+def format_report(violations):
+    # One line per row with all its violations
+    rows = {}
+    for v in violations:
+        rows.setdefault(v['row'], []).append(v)
+    lines = []
+    for row, items in rows.items():
+        label = f"id == {items[0]['id']}" if items[0]['id'] is not None else 'no id'
+        where = f'line {row}, {label}' if row is not None else 'sheet'
+        lines.append(f"* {where}: " + '; '.join(f"{v['column']} {v['message']}" + (f" ({v['value']})" if v['value'] is not None else '') for v in items))
+    return '\n'.join(lines)
+
+
+def write_schema_report(violations, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(violations, f, indent=2, default=str)
+
+
+def check_sheet(data, skip=None, report_path=None):
+    # Validate the sheet in one pass, raise SchemaError with all the violations. The report is
+    # written to report_path (e.g. SCHEMA_REPORT_PATH) when given, even when the sheet is valid.
+    violations = validate(data, SHEET_SCHEMA, skip)
+    if report_path:
+        write_schema_report(violations, report_path)
+    if violations:
+        raise SchemaError(violations)
@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import textwrap
+import pandas as pd
+
+from . import *
+from . import stats
+
+# Too common to narrow a search down
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'he', 'her', 'his', 'in', 'is', 'it',
+    'its', 'of', 'on', 'or', 'she', 'that', 'the', 'their', 'they', 'this', 'to', 'was', 'were', 'who', 'with',
+    'au', 'aux', 'ce', 'dans', 'de', 'des', 'du', 'en', 'est', 'et', 'il', 'la', 'le', 'les', 'pour', 'sur', 'un', 'une',
+}
+
+SHARD_NAME_RE = re.compile(r'[^a-z0-9]')
+
+
+def tokenize(col):
+    # Lower case ASCII terms of at least 2 characters, accents stripped. The JS lookup does the same.
+    return (col.fillna('').astype(str)
+            .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.lower().str.findall(r'[a-z0-9]{2,}'))
+
+
+def shard_name(text):
+    # Shard file of a term or a slug: its first characters, '_' for anything else than [a-z0-9]
+    # (search.js shardName() does the same)
+    return SHARD_NAME_RE.sub('_', text[:SEARCH_PREFIX_LENGTH])
+
+
+def search_postings(videos, keywords):
+    # DataFrame of (term, slug, weight): the weight of a term in a video is the sum of the weights
+    # of the fields it appears in
+    slugs = pd.Series([video['slug_web'] for video in videos], dtype=object).to_numpy()
+    fields = {
+        'title': pd.Series([video['title'] for video in videos], dtype=object),
+        'summary': pd.Series([textwrap.shorten(video['description'], width=SUMMARY_LENGTH, placeholder='') for video in videos], dtype=object),
+    }
+    for kwdtype in keywords.keys():
+        fields[kwdtype] = pd.Series([' '.join(video[kwdtype]) if isinstance(video[kwdtype], list) else '' for video in videos], dtype=object)
+
+    parts = []
+    for field, text in fields.items():
+        terms = tokenize(text).explode().dropna()
+        parts.append(pd.DataFrame({
+            'term': terms.to_numpy(),
+            'slug': slugs[terms.index.to_numpy()],
+            'field': field,
+            'weight': SEARCH_WEIGHTS.get(field, SEARCH_WEIGHTS['keywords']),
+        }))
+    postings = pd.concat(parts, ignore_index=True)
+    postings = postings[~postings['term'].isin(STOPWORDS)].drop_duplicates(['term', 'slug', 'field'])
+    postings = postings.groupby(['term', 'slug'], sort=False)['weight'].sum().reset_index()
+    # Best matches first in each posting list
+    return postings.sort_values(['term', 'weight', 'slug'], ascending=[True, False, True], ignore_index=True)
+
+
+def term_shards(postings):
+    # {shard: {term: [[slug, weight], ...]}}
+    posting = pd.Series([[s, int(w)] for s, w in zip(postings['slug'], postings['weight'])], index=postings.index, dtype=object)
+    postings = postings.assign(shard=postings['term'].map(shard_name), posting=posting)
+    shards = {}
+    for (shard, term), items in postings.groupby(['shard', 'term'], sort=True)['posting']:
+        shards.setdefault(shard, {})[term] = items.tolist()
+    return shards
+
+
+def doc_shards(videos, images):
+    # {shard: {slug: [title, thumbnail]}}, sharded by slug so that only the documents of the results are fetched
+    shards = {}
+    for video in videos:
+        v_images = images.get(video['slug_fs'], None) or {}
+        thumb = v_images.get('thumb', v_images.get('main', None))
+        shards.setdefault(shard_name(video['slug_web']), {})[video['slug_web']] = [video['title'], f'images/{thumb}' if thumb else None]
+    return shards
+
+
+def write_shards(dirpath, shards):
+    # Only the shards whose content changed are rewritten, the ones not produced anymore are removed
+    os.makedirs(dirpath, exist_ok=True)
+    existing = {fname for fname in os.listdir(dirpath) if fname.endswith('.json')}
+    counts = {'written': 0, 'unchanged': 0, 'removed': 0}
+    for shard, content in shards.items():
+        fname = f'{shard}.json'
+        path = os.path.join(dirpath, fname)
+        data = json.dumps(content, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+        if fname in existing:
+            with open(path, encoding='utf-8') as f:
+                if f.read() == data:
+                    counts['unchanged'] += 1
+                    continue
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        counts['written'] += 1
+    for fname in existing - {f'{shard}.json' for shard in shards}:
+        os.remove(os.path.join(dirpath, fname))
+        counts['removed'] += 1
+    return counts
+
+
+def build_search_index(videos, keywords, images):
+    # Static search index in content/search: terms/<prefix>.json posting lists and docs/<prefix>.json
+    # titles & thumbnails, read by the theme's search.js
+    postings = search_postings(videos, keywords)
+    terms = term_shards(postings)
+    docs = doc_shards(videos, images)
+
+    counts = {}
+    for name, shards in [('terms', terms), ('docs', docs)]:
+        counts[name] = write_shards(os.path.join(SEARCH_DIR, name), shards)
+        for key, count in counts[name].items():
+            stats.incr(f'search.{name}.{key}', count)
+    manifest = {'prefix_length': SEARCH_PREFIX_LENGTH, 'stopwords': sorted(STOPWORDS), 'terms': sorted(terms), 'docs': sorted(docs)}
+    write_shards(SEARCH_DIR, {'manifest': manifest})
+
+    print(f"Search index: {postings['term'].nunique()} terms in {len(terms)} shards, "
+          f"{counts['terms']['written'] + counts['docs']['written']} shards written, "
+          f"{counts['terms']['unchanged'] + counts['docs']['unchanged']} unchanged")
+    return counts
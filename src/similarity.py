@@ -0,0 +1,81 @@
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from leven import levenshtein
+
+QGRAM_SIZE = 2
+CHUNK_SIZE = 500
+
+_index = None
+
+
+def qgrams(text, q=QGRAM_SIZE):
+    # Padded q-grams, so that a string of length n always has n + q - 1 of them
+    padded = f'{"^" * (q - 1)}{text}{"$" * (q - 1)}'
+    return Counter(padded[i:i + q] for i in range(len(padded) - q + 1))
+
+
+def build_index(items, threshold):
+    postings = defaultdict(list)
+    grams = []
+    by_length = defaultdict(list)
+    for idx, item in enumerate(items):
+        item_grams = qgrams(item)
+        grams.append(item_grams)
+        by_length[len(item)].append(idx)
+        for gram, count in item_grams.items():
+            postings[gram].append((idx, count))
+    return {'items': items, 'threshold': threshold, 'grams': grams, 'postings': postings, 'by_length': by_length}
+
+
+def candidates(index, i):
+    # Items after i that can be within threshold edits of item i:
+    # lengths differ by at most threshold, and they share enough q-grams (count filter)
+    items, threshold = index['items'], index['threshold']
+    length = len(items[i])
+    min_common = length + QGRAM_SIZE - 1 - threshold * QGRAM_SIZE
+    if min_common <= 0:
+        for other_length in range(max(0, length - threshold), length + threshold + 1):
+            for j in index['by_length'].get(other_length, []):
+                if j > i:
+                    yield j
+        return
+
+    common = defaultdict(int)
+    for gram, count in index['grams'][i].items():
+        for j, other_count in index['postings'][gram]:
+            if j > i:
+                common[j] += min(count, other_count)
+    for j, shared in common.items():
+        if abs(len(items[j]) - length) <= threshold and shared >= max(length, len(items[j])) + QGRAM_SIZE - 1 - threshold * QGRAM_SIZE:
+            yield j
+
+
+def similar_from(index, start, stop):
+    items, threshold = index['items'], index['threshold']
+    out = []
+    for i in range(start, stop):
+        for j in sorted(candidates(index, i)):
+            distance = levenshtein(items[i], items[j])
+            if distance <= threshold:
+                out.append((items[i], items[j], distance))
+    return out
+
+
+def _init_worker(items, threshold):
+    global _index
+    _index = build_index(items, threshold)
+
+
+def _similar_chunk(bounds):
+    return similar_from(_index, *bounds)
+
+
+def find_similar(items, similarity_threshold=3, workers=1):
+    # Pairs (a, b, distance) with distance <= similarity_threshold, sorted by distance
+    if workers > 1 and len(items) > CHUNK_SIZE:
+        chunks = [(start, min(start + CHUNK_SIZE, len(items))) for start in range(0, len(items), CHUNK_SIZE)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(items, similarity_threshold)) as pool:
+            scores = [pair for chunk in pool.map(_similar_chunk, chunks) for pair in chunk]
+    else:
+        scores = similar_from(build_index(items, similarity_threshold), 0, len(items))
+    return sorted(scores, key=lambda x: x[2])
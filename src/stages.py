@@ -0,0 +1,53 @@
+import os
+import pickle
+
+from . import *
+
+# Stage results: the stage writing them, for the error message when they are missing
+STAGE_RESULTS = {
+    'sheet': 'fetch',
+    'clean': 'clean',
+    'keywords': 'keywords',
+    'images': 'images',
+}
+
+
+def plain(value):
+    # Python builtins for the numpy & pandas scalars of the records: the stages reading them back
+    # (generate) do not have to import pandas. Missing values become None.
+    if isinstance(value, dict):
+        return {plain(k): plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if isinstance(value, (str, bytes)):
+        return value
+    if isnull(value):
+        return None
+    if hasattr(value, 'to_pytimedelta'):
+        return value.to_pytimedelta()
+    if hasattr(value, 'to_pydatetime'):
+        return value.to_pydatetime()
+    if type(value).__module__ == 'numpy' and hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def stage_path(name):
+    return os.path.join(STAGES_DIR, f'{name}.pickle')
+
+
+def save_stage(name, value):
+    os.makedirs(STAGES_DIR, exist_ok=True)
+    path = stage_path(name)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_stage(name):
+    path = stage_path(name)
+    if not os.path.isfile(path):
+        raise RuntimeError(f'No {name} results in {path}, run "create_content.py {STAGE_RESULTS[name]}" first')
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -0,0 +1,81 @@
+import cProfile
+import contextlib
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+from . import *
+
+_stages = {}
+_counters = {}
+_profile = {'stage': None, 'path': None}
+_lock = threading.Lock()
+_started = datetime.datetime.now()
+
+
+def reset():
+    global _started
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+        _started = datetime.datetime.now()
+
+
+def incr(name, value=1):
+    # Counters are updated from the download threads too
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def profile(stage_name, path=None):
+    # cProfile the given stage, the stats are dumped to path (default: .cache/<stage>.prof)
+    _profile['stage'] = stage_name
+    _profile['path'] = path or os.path.join(CACHE_DIR, f'{stage_name}.prof')
+
+
+@contextlib.contextmanager
+def stage(name):
+    profiler = None
+    if _profile['stage'] == name:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(os.path.dirname(os.path.abspath(_profile['path'])), exist_ok=True)
+            profiler.dump_stats(_profile['path'])
+            print(f'Wrote {name} profile to {_profile["path"]}')
+        with _lock:
+            timing = _stages.setdefault(name, {'wall_seconds': 0.0, 'cpu_seconds': 0.0, 'runs': 0})
+            timing['wall_seconds'] += wall
+            timing['cpu_seconds'] += cpu
+            timing['runs'] += 1
+
+
+def report():
+    with _lock:
+        return {
+            'started': _started.isoformat(timespec='seconds'),
+            'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+            'argv': sys.argv,
+            'stages': {name: {k: round(v, 4) for k, v in timing.items()} for name, timing in _stages.items()},
+            'counters': dict(sorted(_counters.items())),
+        }
+
+
+def write_report(path=RUN_REPORT_PATH):
+    out = report()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(out, f, indent=2)
+    for name, timing in out['stages'].items():
+        print(f"{name:<10} {timing['wall_seconds']:>9.3f}s wall {timing['cpu_seconds']:>9.3f}s cpu")
+    print(f'Wrote run report to {path}')
+    return out
@@ -0,0 +1,116 @@
+import re
+import urllib.parse as urlparse
+import numpy as np
+import pandas as pd
+
+# Links with nothing urlparse would decode, split or normalize (no percent-encoding, '+', ';',
+# fragment, spaces or upper case scheme): their parts are extracted for all links at once.
+# The other links go through parse_stream_url.
+PLAIN_URL_RE = re.compile(r'^https?://(?P<netloc>[A-Za-z0-9.:-]*)(?P<path>/[A-Za-z0-9._~/-]*)?(?:\?(?P<query>[A-Za-z0-9._~=&-]*))?$')
+YOUTUBE_VID_RE = re.compile(r'(?:^|&)v=([^&]+)')
+VIMEO_VID_RE = re.compile(r'.*vimeo\.com\/([0-9]+)$')
+# Last segment of the path
+DAILYMOTION_VID_RE = re.compile(r'([^/]*)$')
+PROVIDERS = ['youtube', 'vimeo', 'dailymotion']
+
+MEDIA_COLUMNS = ['player_vid', 'player_type', 'player_url', 'link_vod', 'link_fm']
+
+
+def parse_stream_url(video_id, ss):
+    out = None
+    try:
+        url = urlparse.urlparse(ss)
+        out = {}
+        if 'youtube' in url.netloc:
+            out['type'] = 'youtube'
+            out['vid'] = urlparse.parse_qs(url.query)['v'][0]
+            out['url'] = url
+        elif 'vimeo' in url.netloc:
+            out['type'] = 'vimeo'
+            out['vid'] = VIMEO_VID_RE.match(f'{url.netloc}{url.path}').groups()[0]
+            out['url'] = url
+        elif 'dailymotion' in url.netloc:
+            out['type'] = 'dailymotion'
+            out['vid'] = url.path.split('/')[-1]
+            out['url'] = url
+        else:
+            out = None
+    except (KeyError, AttributeError, ValueError):
+        # No video id in the url
+        out = None
+
+    return out
+
+
+def classify_links(col):
+    # 'type', 'vid' and 'url' columns for a column of links, type is 'no_link' for missing links and
+    # 'unsupported' for links of other sites or without a video id (parse_stream_url rules).
+    # Each distinct link is classified once.
+    codes, uniques = pd.factorize(col)
+    links = pd.Series(uniques, dtype=object)
+    parts = links.str.extract(PLAIN_URL_RE)
+    netloc = parts['netloc'].fillna('')
+    path = parts['path'].fillna('')
+    link_type = pd.Series(None, index=links.index, dtype=object)
+    for provider in reversed(PROVIDERS):
+        # The first provider found in the host wins, as in parse_stream_url
+        link_type = link_type.mask(netloc.str.contains(provider, regex=False), provider)
+    # Video id of each provider's links
+    vid = pd.Series(None, index=links.index, dtype=object)
+    for provider, values, pattern in [('youtube', parts['query'], YOUTUBE_VID_RE), ('vimeo', netloc + path, VIMEO_VID_RE), ('dailymotion', path, DAILYMOTION_VID_RE)]:
+        rows = link_type.eq(provider)
+        vid[rows] = values[rows].str.extract(pattern, expand=False)
+    supported = vid.notna()
+    link_type = link_type.where(supported, 'unsupported')
+    vid = vid.where(supported, None)
+    url = links.where(supported, None)
+
+    # Links the patterns do not cover, one by one
+    for i in np.flatnonzero(parts['netloc'].isna().to_numpy()):
+        linfo = parse_stream_url(links[i], links[i])
+        link_type[i], vid[i], url[i] = ('unsupported', None, None) if linfo is None else (linfo['type'], linfo['vid'], linfo['url'].geturl())
+
+    classified = [np.append(values.to_numpy(dtype=object), fill) for values, fill in [(link_type, 'no_link'), (vid, None), (url, None)]]
+    return pd.DataFrame({'type': classified[0][codes], 'vid': classified[1][codes], 'url': classified[2][codes]}, index=col.index)
+
+
+def stream_metas(data):
+    # player_vid, player_type, player_url, link_vod and link_fm columns (NaN when absent) from the
+    # link_stream, link_trailer, free_access and dead_links (optional) columns
+    links = {}
+    for key in ['link_stream', 'link_trailer']:
+        col = data[key]
+        # Links reported dead by the last link check count as missing
+        if 'dead_links' in data:
+            dead = pd.Series([isinstance(d, list) and link in d for link, d in zip(col, data['dead_links'])], index=data.index)
+            col = col.mask(dead)
+        links[key] = classify_links(col)
+    stream, trailer = links['link_stream'], links['link_trailer']
+    free = data['free_access'].where(data['free_access'].notna(), False).astype(bool)
+
+    stream_ok = stream['type'].isin(PROVIDERS)
+    trailer_ok = trailer['type'].isin(PROVIDERS)
+    # Free: the stream in the player, the trailer when the stream is not supported.
+    # Not free: the trailer in the player, the stream as VOD link.
+    use_stream = free & stream_ok
+    use_trailer = ~use_stream & trailer_ok
+
+    out = pd.DataFrame(index=data.index)
+    for column, field in [('player_vid', 'vid'), ('player_type', 'type'), ('player_url', 'url')]:
+        out[column] = stream[field].where(use_stream, trailer[field].where(use_trailer))
+    out['link_vod'] = data['link_stream'].where(~free & stream['type'].ne('no_link'))
+    out['link_fm'] = data['link_stream'].where(free & stream['type'].eq('unsupported'))
+    return out[MEDIA_COLUMNS]
+
+
+def add_media_metas(videos):
+    # Set video['media_metas'], the player & link metadata of the video pages, for all videos at once
+    if not videos:
+        return videos
+    columns = ['link_stream', 'link_trailer', 'free_access', 'dead_links']
+    data = pd.DataFrame({key: [video.get(key, np.nan) for video in videos] for key in columns})
+    metas = stream_metas(data)
+    rows = zip(*(metas[column].tolist() for column in MEDIA_COLUMNS))
+    for video, row in zip(videos, rows):
+        video['media_metas'] = {key: value for key, value in zip(MEDIA_COLUMNS, row) if isinstance(value, str)}
+    return videos
@@ -1,12 +1,15 @@
 # -*- coding: utf-8 -*-
 
 import os
+import glob
+import json
 import shlex
 import shutil
 import sys
 import datetime
 
 from invoke import task
+from invoke.exceptions import Exit
 from invoke.main import program
 from invoke.util import cd
 from pelican import main as pelican_main
@@ -30,6 +33,22 @@ CONFIG = {
     # Host and port for `serve`
     'host': 'localhost',
     'port': 8000,
+    # Remote server configuration for `publish`, the web server serves {ssh_path}/current.
+    # No defaults: publish fails until they are set.
+    'ssh_user': None,
+    'ssh_host': None,
+    'ssh_port': '22',
+    'ssh_path': None,
+}
+
+# Settings of `build --incremental`: keep the output directory, cache the parsed content
+# and only render the pages whose articles changed (runningimages plugin)
+INCREMENTAL_SETTINGS = {
+    'RUNNINGIMAGES_INCREMENTAL': True,
+    'DELETE_OUTPUT_DIRECTORY': False,
+    'LOAD_CONTENT_CACHE': True,
+    'CACHE_CONTENT': True,
+    'STATIC_CHECK_IF_MODIFIED': True,
 }
 
 @task
@@ -40,9 +59,12 @@ def clean(c):
         os.makedirs(CONFIG['deploy_path'])
 
 @task
-def build(c):
-    """Build local version of site"""
-    pelican_run('-s {settings_base}'.format(**CONFIG))
+def build(c, incremental=False):
+    """Build local version of site, `--incremental` only renders what changed since the last build"""
+    if incremental:
+        pelican_run('{} -s {settings_base}'.format(extra_settings(INCREMENTAL_SETTINGS), **CONFIG))
+    else:
+        pelican_run('-s {settings_base}'.format(**CONFIG))
 
 @task
 def rebuild(c):
@@ -80,49 +102,164 @@ def preview(c):
     """Build production version of site"""
     pelican_run('-s {settings_publish}'.format(**CONFIG))
 
+class BatchRebuild:
+    """Collects the files livereload reports changed, hands them to on_batch in one batch"""
+
+    def __init__(self, on_batch, debounce):
+        # on_batch is called once nothing changed for `debounce` seconds and returns the path to reload
+        self.on_batch = on_batch
+        self.debounce = debounce
+        self.pending = set()
+        self.timeout = None
+
+    def watch(self, server, path):
+        # livereload calls func with the changed files of a glob, without arguments for a single file
+        # or when files were only removed: the watched path is then rebuilt as a whole
+        def changed(files=None):
+            self.pending.update(files if isinstance(files, list) else [path])
+            self.schedule()
+        # 'forever': the browser is reloaded by flush(), once per batch
+        server.watch(path, changed, delay='forever')
+
+    def schedule(self):
+        from tornado.ioloop import IOLoop
+        loop = IOLoop.current()
+        if self.timeout is not None:
+            loop.remove_timeout(self.timeout)
+        self.timeout = loop.call_later(self.debounce, self.flush)
+
+    def flush(self):
+        from livereload.handlers import LiveReloadHandler
+        self.timeout = None
+        batch, self.pending = sorted(self.pending), set()
+        LiveReloadHandler.reload_waiters(self.on_batch(batch))
+
+def classify_change(path):
+    """settings, template, static or content"""
+    path = os.path.abspath(path)
+    theme_path = os.path.abspath(SETTINGS['THEME'])
+    if path in (os.path.abspath(CONFIG['settings_base']), os.path.abspath('sitemeta.json')):
+        return 'settings'
+    if path.startswith(os.path.join(theme_path, 'templates') + os.sep):
+        return 'template'
+    if path.startswith(os.path.join(theme_path, 'static') + os.sep):
+        return 'static'
+    return 'content'
+
+def copy_theme_static(paths):
+    """Copy (or remove) changed theme static files in the output, returns their output paths"""
+    static_path = os.path.join(SETTINGS['THEME'], 'static')
+    output_static_path = os.path.join(CONFIG['deploy_path'], SETTINGS['THEME_STATIC_DIR'])
+    # Watched globs (files removed) stand for all their sources and outputs
+    relpaths = set()
+    for pattern in paths:
+        relpaths.update(os.path.relpath(path, static_path) for path in glob.glob(pattern, recursive=True))
+        relpattern = os.path.relpath(pattern, static_path)
+        relpaths.update(os.path.relpath(path, output_static_path)
+                        for path in glob.glob(os.path.join(output_static_path, relpattern), recursive=True))
+    outputs = []
+    for relpath in sorted(relpaths):
+        path = os.path.join(static_path, relpath)
+        target = os.path.join(output_static_path, relpath)
+        if os.path.isfile(path):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(path, target)
+        elif os.path.isfile(target):
+            os.remove(target)
+        outputs.append('/'.join([SETTINGS['THEME_STATIC_DIR']] + relpath.split(os.sep)))
+    return outputs
+
+def rebuild_changes(c, paths):
+    """Smallest rebuild for a batch of changed files, returns the path the browser reloads"""
+    changes = {}
+    for path in paths:
+        changes.setdefault(classify_change(path), []).append(path)
+    sys.stderr.write('Changed: {}\n'.format(', '.join('{} {}'.format(len(v), k) for k, v in sorted(changes.items()))))
+    if 'settings' in changes:
+        build(c)
+    elif 'content' in changes or 'template' in changes:
+        # Only the pages of the changed articles are rendered, all of them after a template change
+        build(c, incremental=True)
+    else:
+        outputs = copy_theme_static(changes['static'])
+        # A single stylesheet is swapped in place by livereload.js
+        if len(outputs) == 1 and outputs[0].endswith('.css'):
+            return outputs[0]
+    return '*'
+
 @task
-def livereload(c):
-    """Automatically reload browser tab upon file modification."""
+def livereload(c, debounce=0.5):
+    """Automatically reload browser tab upon file modification.
+
+    Changes are batched until nothing changed for `debounce` seconds, then rebuilt at once."""
     from livereload import Server
-    build(c)
+    build(c, incremental=True)
     server = Server()
-    # Watch the base settings file
-    server.watch(CONFIG['settings_base'], lambda: build(c))
+    batch = BatchRebuild(lambda paths: rebuild_changes(c, paths), float(debounce))
+    # Watch the base settings file and the site metadata it loads
+    batch.watch(server, CONFIG['settings_base'])
+    batch.watch(server, 'sitemeta.json')
     # Watch content source files
-    content_file_extensions = ['.md', '.rst']
+    content_file_extensions = ['.md', '.rst', '.jsonl']
     for extension in content_file_extensions:
         content_blob = '{0}/**/*{1}'.format(SETTINGS['PATH'], extension)
-        server.watch(content_blob, lambda: build(c))
+        batch.watch(server, content_blob)
     # Watch the theme's templates and static assets
     theme_path = SETTINGS['THEME']
-    server.watch('{}/templates/*.html'.format(theme_path), lambda: build(c))
+    batch.watch(server, '{}/templates/*.html'.format(theme_path))
     static_file_extensions = ['.css', '.js']
     for extension in static_file_extensions:
         static_file = '{0}/static/**/*{1}'.format(theme_path, extension)
-        server.watch(static_file, lambda: build(c))
+        batch.watch(server, static_file)
     # Serve output path on configured host and port
     server.serve(host=CONFIG['host'], port=CONFIG['port'], root=CONFIG['deploy_path'])
 
 
+@task
+def compress(c, precompress=True):
+    """Minify HTML/CSS and write .gz/.br siblings of the generated files
+
+    --no-precompress: minify only, removes the .gz/.br siblings"""
+    from src.compress import compress_site
+    compress_site(CONFIG['deploy_path'], precompress=precompress)
+
+def ssh_target():
+    missing = [key for key in ['ssh_user', 'ssh_host', 'ssh_path'] if not CONFIG[key]]
+    if missing:
+        raise Exit('Set {} in the CONFIG of tasks.py, or pass --target'.format(', '.join(missing)))
+    return '{ssh_user}@{ssh_host}:{ssh_path}'.format(**CONFIG)
+
+@task
+def deploy(c, target=None, full=False, dry_run=False):
+    """Upload the files changed since the last deploy as a new release and switch to it
+
+    target: a local directory or user@host:path (default: the ssh_* settings)"""
+    from src.deploy import deploy as deploy_site
+    deploy_site(CONFIG['deploy_path'], target or ssh_target(),
+                port=CONFIG['ssh_port'], full=full, dry_run=dry_run)
+
 @task
 def publish(c):
-    """Publish to production via rsync"""
+    """Publish to production via delta deploy"""
+    # Fail before building when the server is not configured
+    ssh_target()
     pelican_run('-s {settings_publish}'.format(**CONFIG))
-    c.run(
-        'rsync --delete --exclude ".DS_Store" -pthrvz -c '
-        '-e "ssh -p {ssh_port}" '
-        '{} {ssh_user}@{ssh_host}:{ssh_path}'.format(
-            CONFIG['deploy_path'].rstrip('/') + '/',
-            **CONFIG))
+    compress(c)
+    deploy(c)
 
 @task
 def gh_pages(c):
     """Publish to GitHub Pages"""
     preview(c)
+    # GitHub Pages compresses on the fly and never serves the .gz/.br siblings
+    compress(c, precompress=False)
     c.run('ghp-import -b {github_pages_branch} '
           '-m {commit_message} '
           '{deploy_path} -p'.format(**CONFIG))
 
+def extra_settings(settings):
+    return '-e ' + ' '.join(shlex.quote('{}={}'.format(key, json.dumps(value))) for key, value in settings.items())
+
 def pelican_run(cmd):
     cmd += ' ' + program.core.remainder  # allows to pass-through args to pelican
     pelican_main(shlex.split(cmd))
\ No newline at end of file
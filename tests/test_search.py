@@ -0,0 +1,28 @@
+import json
+import os
+import re
+
+from src import BASEDIR, search
+
+SEARCH_JS = os.path.join(BASEDIR, 'themes', 'runningimages', 'static', 'js', 'search.js')
+
+
+def js_shard_name(text, prefix_length):
+    # search.js shardName(), with the pattern read from the script
+    with open(SEARCH_JS) as f:
+        pattern = re.search(r"function shardName\(text\) \{\s*return text\.slice\(0, manifest\.prefix_length\)\.replace\(/(.+?)/g, '_'\);", f.read()).group(1)
+    return re.sub(pattern, '_', text[:prefix_length])
+
+
+def test_hyphenated_slug_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(search, 'SEARCH_DIR', str(tmp_path))
+    videos = [{'slug_web': 'a-race-for-the-soul', 'slug_fs': 'a_race_for_the_soul', 'title': 'A Race for the Soul',
+               'description': 'Trail running film', 'events': ['Western States 100']}]
+    search.build_search_index(videos, {'events': {}}, {})
+
+    with open(tmp_path / 'manifest.json') as f:
+        manifest = json.load(f)
+    shard = js_shard_name('a-race-for-the-soul', manifest['prefix_length'])
+    assert shard in manifest['docs']
+    with open(tmp_path / 'docs' / f'{shard}.json') as f:
+        assert 'a-race-for-the-soul' in json.load(f)
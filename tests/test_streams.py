@@ -0,0 +1,82 @@
+import itertools
+
+import numpy as np
+
+from src.streams import add_media_metas, parse_stream_url
+
+LINKS = [
+    np.nan,
+    'https://www.youtube.com/watch?v=wz_2M2jzCUg',
+    'https://www.youtube.com/watch?feature=share&v=wz_2M2jzCUg&t=10',
+    'https://www.youtube.com/watch?v=&v=abc',
+    'https://www.youtube.com/watch?v=a%2Bb',
+    'https://www.youtube.com/watch?v=a+b#t=10',
+    'HTTPS://www.youtube.com/watch?v=abc',
+    '  https://www.youtube.com/watch?v=abc',
+    'https://www.youtube.com/channel/abc',
+    'https://youtu.be/abc',
+    'https://vimeo.com/123456',
+    'https://vimeo.com/123;foo',
+    'https://vimeo.com/123/',
+    'https://vimeo.com/ondemand/film',
+    'https://player.vimeo.com/video/123456?h=ab',
+    'https://www.dailymotion.com/video/x7tgad0',
+    'https://www.dailymotion.com/',
+    'https://www.example.org/film',
+    'not a link',
+]
+
+
+def reference_media_metas(video):
+    # media_metas before the links were classified for all videos at once
+    player = None
+    link_vod = None
+    link_fm = None
+
+    free = video['free_access'] if video['free_access'] is not np.nan else False
+    dead_links = video.get('dead_links', [])
+
+    def qualify_stream(link):
+        if link is np.nan or link in dead_links:
+            return {'type': 'no_link'}
+        linfo = parse_stream_url(link, link)
+        if linfo is None:
+            return {'type': 'unsupported'}
+        return linfo
+    link_stream = qualify_stream(video['link_stream'])
+    link_trailer = qualify_stream(video['link_trailer'])
+
+    if not free:
+        if link_stream['type'] != 'no_link':
+            link_vod = video['link_stream']
+        if link_trailer['type'] not in ['no_link', 'unsupported']:
+            player = link_trailer
+    else:
+        if link_stream['type'] not in ['no_link', 'unsupported']:
+            player = link_stream
+        if link_stream['type'] == 'unsupported':
+            link_fm = video['link_stream']
+        if link_trailer['type'] not in ['no_link', 'unsupported'] and player is None:
+            player = link_trailer
+
+    out = {}
+    if player is not None:
+        out['player_vid'] = player['vid']
+        out['player_type'] = player['type']
+        out['player_url'] = player['url'].geturl()
+    if link_vod is not None:
+        out['link_vod'] = link_vod
+    if link_fm is not None:
+        out['link_fm'] = link_fm
+    return out
+
+
+def test_media_metas_match_the_per_video_rules():
+    videos = [{'link_stream': stream, 'link_trailer': trailer, 'free_access': free, 'dead_links': dead}
+              for stream, trailer in itertools.product(LINKS, repeat=2)
+              for free in [True, False, np.nan]
+              for dead in [[], [stream]]]
+    expected = [reference_media_metas(video) for video in videos]
+    add_media_metas(videos)
+    for video, metas in zip(videos, expected):
+        assert video['media_metas'] == metas, video
@@ -0,0 +1,40 @@
+// "More videos" of the tag and year pages: the next shards of the listing in the static JSON API
+// (plugins/runningimages/api.py), each shard gives the path of the next one.
+(function () {
+    var button = document.getElementById('load-more');
+    if (!button) return;
+    var list = document.getElementById('video-list');
+    var root = button.dataset.root;
+    var next = button.dataset.next;
+
+    // Two videos per row, as in article_list.html
+    function append(items) {
+        for (var i = 0; i < items.length; i += 2) {
+            var row = document.createElement('div');
+            row.className = 'columns is-desktop';
+            items.slice(i, i + 2).forEach(function (item) {
+                var column = document.createElement('div');
+                column.className = 'column';
+                column.innerHTML = item.html;
+                row.appendChild(column);
+            });
+            list.appendChild(row);
+        }
+    }
+
+    button.addEventListener('click', function () {
+        if (button.classList.contains('is-loading')) return;
+        button.classList.add('is-loading');
+        fetch(root + '/' + next).then(function (r) {
+            if (!r.ok) throw new Error(r.status);
+            return r.json();
+        }).then(function (shard) {
+            append(shard.items);
+            next = shard.next;
+            button.classList.remove('is-loading');
+            if (!next) button.parentNode.removeChild(button);
+        }).catch(function () {
+            button.classList.remove('is-loading');
+        });
+    });
+})();
@@ -0,0 +1,129 @@
+// Lookup in the static search index built by create_content.py (content/search).
+// Only the term shards of the query and the document shards of the results are fetched.
+(function () {
+    var form = document.getElementById('search-form');
+    if (!form) return;
+    var input = form.querySelector('input');
+    var results = document.getElementById('search-results');
+    var root = form.dataset.root;
+    var articleUrl = form.dataset.articleUrl;
+    var maxResults = 10;
+    var cache = {};
+    var manifest = null;
+    var pending = 0;
+
+    function fetchJson(path) {
+        if (!(path in cache)) {
+            cache[path] = fetch(root + '/search/' + path).then(function (r) {
+                return r.ok ? r.json() : {};
+            }).catch(function () { return {}; });
+        }
+        return cache[path];
+    }
+
+    // Same as src/search.py tokenize()
+    function tokenize(text) {
+        var terms = text.normalize('NFKD').replace(/[^\x00-\x7f]/g, '').toLowerCase().match(/[a-z0-9]{2,}/g) || [];
+        return terms.filter(function (t) {
+            return manifest.stopwords.indexOf(t) < 0 && t.length >= manifest.prefix_length;
+        });
+    }
+
+    // Same as src/search.py shard_name()
+    function shardName(text) {
+        return text.slice(0, manifest.prefix_length).replace(/[^a-z0-9]/g, '_');
+    }
+
+    // {slug: score} of the videos with a term starting with token
+    function lookup(token) {
+        var shard = shardName(token);
+        if (manifest.terms.indexOf(shard) < 0) return Promise.resolve({});
+        return fetchJson('terms/' + shard + '.json').then(function (terms) {
+            var scores = {};
+            Object.keys(terms).forEach(function (term) {
+                if (term.lastIndexOf(token, 0) !== 0) return;
+                terms[term].forEach(function (posting) {
+                    var score = term === token ? posting[1] : posting[1] / 2;
+                    scores[posting[0]] = Math.max(scores[posting[0]] || 0, score);
+                });
+            });
+            return scores;
+        });
+    }
+
+    function search(query) {
+        if (!manifest.terms) return Promise.resolve([]);
+        var tokens = tokenize(query);
+        if (!tokens.length) return Promise.resolve([]);
+        return Promise.all(tokens.map(lookup)).then(function (all) {
+            // Videos matching every token, best total score first
+            var ranked = Object.keys(all[0]).filter(function (slug) {
+                return all.every(function (scores) { return slug in scores; });
+            }).map(function (slug) {
+                return [slug, all.reduce(function (sum, scores) { return sum + scores[slug]; }, 0)];
+            }).sort(function (a, b) {
+                return b[1] - a[1] || (a[0] < b[0] ? -1 : 1);
+            }).slice(0, maxResults);
+            var shards = {};
+            ranked.forEach(function (item) { shards[shardName(item[0])] = true; });
+            return Promise.all(Object.keys(shards).map(function (shard) {
+                return fetchJson('docs/' + shard + '.json');
+            })).then(function (docShards) {
+                var docs = Object.assign.apply(null, [{}].concat(docShards));
+                return ranked.filter(function (item) { return item[0] in docs; }).map(function (item) {
+                    return {slug: item[0], title: docs[item[0]][0], thumb: docs[item[0]][1]};
+                });
+            });
+        });
+    }
+
+    function render(items, query) {
+        results.innerHTML = '';
+        if (!query) {
+            form.classList.remove('is-active');
+            return;
+        }
+        if (!items.length) {
+            var empty = document.createElement('div');
+            empty.className = 'dropdown-item';
+            empty.textContent = 'No video found';
+            results.appendChild(empty);
+        }
+        items.forEach(function (item) {
+            var link = document.createElement('a');
+            link.className = 'dropdown-item search-result';
+            link.href = root + '/' + articleUrl.replace('{slug}', item.slug);
+            if (item.thumb) {
+                var img = document.createElement('img');
+                img.src = root + '/' + item.thumb;
+                img.alt = '';
+                img.loading = 'lazy';
+                link.appendChild(img);
+            }
+            link.appendChild(document.createTextNode(item.title));
+            results.appendChild(link);
+        });
+        form.classList.add('is-active');
+    }
+
+    var timer = null;
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () {
+            var query = input.value.trim();
+            var current = ++pending;
+            fetchJson('manifest.json').then(function (m) {
+                manifest = m;
+                return search(query);
+            }).then(function (items) {
+                // Drop the answers to outdated queries
+                if (current === pending) render(items, query);
+            });
+        }, 150);
+    });
+    form.addEventListener('submit', function (event) {
+        event.preventDefault();
+        var first = results.querySelector('a.search-result');
+        if (first) window.location.href = first.href;
+    });
+})();